@@ -0,0 +1,183 @@
+"""
+Asyncio monitoring engine for Mac Proximity Lock.
+
+Runs the same per-cycle decision logic as ProximityLock.monitor(), but looks
+the trusted devices up with concurrent, cancellable probes on async
+subprocesses: the batched blueutil query races per-device
+`blueutil --info <mac>` / `blueutil --info <name>` lookups, the first
+authoritative answer wins and the rest are cancelled. A slow Bluetooth
+stack then costs one probe timeout per cycle instead of the sum of all of
+them, and the lookups as a whole are cancelled once the cycle budget's
+lookup phase runs out.
+"""
+
+import asyncio
+import selectors
+
+from device_query import QueryFailed, QueryTimeout, combine_presence
+
+
+class _VirtualTimeSelector(selectors.DefaultSelector):
+    """Selector that advances the virtual clock instead of blocking"""
+
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if not events and timeout:
+            self.clock.offset += timeout
+        return events
+
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    """Event loop whose timers run on a VirtualClock, so simulated async
+    probes overlap the way real ones would but finish instantly"""
+
+    def __init__(self, clock):
+        super().__init__(_VirtualTimeSelector(clock))
+        self.virtual_clock = clock
+
+    def time(self):
+        return self.virtual_clock.offset
+
+
+class AsyncMonitor:
+    """Drives ProximityLock.run_cycle() from an asyncio event loop"""
+
+    def __init__(self, lock):
+        self.lock = lock
+        # The batched query normally answers first with a single call; the
+        # --info lookups are only raced against it once it is this late
+        self.hedge_delay = lock.config.get('async_hedge_delay', 1.0)
+
+    async def _batched_lookup(self):
+        with self.lock.metrics.probe('find_device') as probe:
+            try:
+                devices = await self.lock.device_query.find_all_async(self.lock.targets)
+            except QueryFailed as e:
+                probe.outcome = 'timeout' if isinstance(e, QueryTimeout) else 'error'
+                self.lock.logger.debug(f"Batched device query failed: {e}")
+                return False, None
+        # A successful batched query is authoritative even when a device is missing
+        return True, devices
+
+    async def _direct_lookup(self, device_id):
+        with self.lock.metrics.probe('get_device_info_direct'):
+            result = await self.lock.probe_backend.run_async([
+                'blueutil', '--info', device_id, '--format', 'json'
+            ], timeout=3)
+            device = self.lock.parse_device_info(result)
+        return device is not None, device
+
+    async def _target_lookup(self, target):
+        """Race `--info <mac>` against `--info <name>` for one trusted device"""
+        lookups = []
+        if target.mac:
+            lookups.append(self._direct_lookup(target.blueutil_mac))
+        if target.name:
+            lookups.append(self._direct_lookup(target.name))
+        pending = set(asyncio.ensure_future(lookup) for lookup in lookups)
+        try:
+            return await self._first_authoritative(pending)
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _hedge_lookup(self):
+        """Direct lookups of every trusted device; authoritative once any of them answered"""
+        results = await asyncio.gather(*(self._target_lookup(target) for target in self.lock.targets))
+        return any(found for found, _ in results), [device for _, device in results]
+
+    async def _first_authoritative(self, pending, timeout=None):
+        """Wait for the first task in pending that gives an authoritative answer.
+
+        Finished tasks are removed from pending. Returns (found, device_info).
+        """
+        while pending:
+            done, _ = await asyncio.wait(pending, timeout=timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                return False, None
+            for task in done:
+                pending.discard(task)
+                try:
+                    authoritative, device = task.result()
+                except Exception as e:
+                    self.lock.logger.debug(f"Async device probe failed: {e}")
+                    continue
+                if authoritative:
+                    return True, device
+        return False, None
+
+    async def find_targets(self):
+        """Concurrent version of ProximityLock.find_targets()"""
+        pending = {asyncio.ensure_future(self._batched_lookup())}
+        try:
+            if self.hedge_delay > 0:
+                found, devices = await self._first_authoritative(pending, timeout=self.hedge_delay)
+                if found:
+                    return devices
+            pending.add(asyncio.ensure_future(self._hedge_lookup()))
+            found, devices = await self._first_authoritative(pending)
+            return devices if found else [None] * len(self.lock.targets)
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def run(self):
+        lock = self.lock
+        while True:
+            if lock.handle_control_requests():
+                await lock.clock.async_sleep(lock.config['scan_interval'])
+                continue
+
+            lock.cycle += 1
+            started = lock.clock.now()
+            lock.budget.start()
+            try:
+                lock.presence = await asyncio.wait_for(self.find_targets(), lock.budget.remaining())
+            except asyncio.TimeoutError:
+                lock.logger.debug("Device lookups cancelled: cycle budget spent")
+                lock.metrics.count('lookups_cancelled')
+                lock.presence = [None] * len(lock.targets)
+            device_info = combine_presence(lock.presence, lock.config['presence_policy'])
+            looked_up = lock.clock.now()
+            lock.budget.decide()
+            skip_sleep = lock.run_cycle(lock.cycle, device_info)
+            lock.record_cycle(started, looked_up, device_info)
+            if skip_sleep:
+                continue
+
+            await lock.clock.async_sleep(lock.next_scan_interval(device_info))
+
+
+def _cancel_pending(loop):
+    tasks = [task for task in asyncio.all_tasks(loop) if not task.done()]
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+
+
+def run_async_monitor(lock):
+    """Async equivalent of ProximityLock.monitor()"""
+    if not lock.start_monitoring():
+        return
+
+    lock.logger.info("Engine: asyncio (concurrent device probes)")
+    loop = lock.clock.new_event_loop()
+    try:
+        loop.run_until_complete(AsyncMonitor(lock).run())
+    except KeyboardInterrupt:
+        lock.logger.info("\n🛑 Monitoring stopped by user")
+    finally:
+        _cancel_pending(loop)
+        loop.close()
+        lock.stop_servers()
+        lock.stop_recording()
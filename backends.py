@@ -0,0 +1,474 @@
+"""
+Probe backends for Mac Proximity Lock.
+
+Every command ProximityLock runs to look at the Bluetooth stack or the screen
+goes through a backend. SubprocessBackend runs the real blueutil/ioreg/pgrep/
+osascript tools; FakeBackend is a scriptable stand-in that answers the same
+commands from a presence timeline so the monitor can be measured off a Mac.
+asyncio is only imported by the coroutine methods, so the synchronous
+monitor and the CLI commands don't pay for loading it.
+"""
+
+import bisect
+import contextlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+class SimulationFinished(Exception):
+    """Raised by VirtualClock when the simulated run reaches its end"""
+
+
+class SystemClock:
+    """Wall clock used by the real monitor"""
+
+    simulated = False
+
+    def now(self):
+        return datetime.now()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def elapse(self, seconds):
+        """Let time pass while a probe is running"""
+        time.sleep(seconds)
+
+    async def async_sleep(self, seconds):
+        import asyncio
+        await asyncio.sleep(seconds)
+
+    def new_event_loop(self):
+        import asyncio
+        return asyncio.new_event_loop()
+
+    def detached_elapsed(self):
+        return 0.0
+
+
+class DetachedTimer:
+    """Collects time elapsed by work that runs off the main timeline"""
+
+    def __init__(self):
+        self.elapsed = 0.0
+
+
+class VirtualClock:
+    """Simulated clock that only moves when something sleeps or elapses"""
+
+    simulated = True
+
+    def __init__(self, start=None, end_after=None, on_sleep=None):
+        self.start = start or datetime(2024, 1, 1, 9, 0, 0)
+        self.offset = 0.0
+        self.end_after = end_after
+        self.on_sleep = on_sleep
+        self.detached_timers = []
+
+    def now(self):
+        return self.start + timedelta(seconds=self.offset)
+
+    def sleep(self, seconds):
+        if self.on_sleep:
+            self.on_sleep(self.offset, seconds)
+        self.elapse(seconds)
+
+    def elapse(self, seconds):
+        if self.detached_timers:
+            self.detached_timers[-1].elapsed += seconds
+            return
+        self.offset += seconds
+        self.check_finished()
+
+    @contextlib.contextmanager
+    def detached(self):
+        """Time work as if it ran in the background: elapse() inside the
+        block is recorded on the yielded timer instead of moving the clock"""
+        timer = DetachedTimer()
+        self.detached_timers.append(timer)
+        try:
+            yield timer
+        finally:
+            self.detached_timers.pop()
+
+    def detached_elapsed(self):
+        """Time elapsed so far inside the innermost detached() block (0 outside one)"""
+        return self.detached_timers[-1].elapsed if self.detached_timers else 0.0
+
+    def check_finished(self):
+        if self.end_after is not None and self.offset >= self.end_after:
+            raise SimulationFinished()
+
+    async def async_sleep(self, seconds):
+        import asyncio
+        if self.on_sleep:
+            self.on_sleep(self.offset, seconds)
+        await asyncio.sleep(seconds)
+        self.check_finished()
+
+    def new_event_loop(self):
+        from async_engine import VirtualTimeEventLoop
+        return VirtualTimeEventLoop(self)
+
+
+class ProbeBackend:
+    """Interface for everything ProximityLock asks of the operating system"""
+
+    def run(self, args, timeout=None, check=False):
+        """Run a command and return a subprocess.CompletedProcess.
+
+        Must raise subprocess.TimeoutExpired / CalledProcessError the same way
+        subprocess.run does so callers keep their error handling.
+        """
+        raise NotImplementedError
+
+    def quartz_session(self):
+        """Return the CoreGraphics session dictionary, or raise ImportError"""
+        raise NotImplementedError
+
+    async def run_async(self, args, timeout=None):
+        """Coroutine version of run(); cancelling it must stop the command"""
+        return self.run(args, timeout=timeout)
+
+    def subscribe_screen_lock(self, callback):
+        """Call callback(locked) on screen lock/unlock; False if unsupported"""
+        return False
+
+    def which(self, command):
+        """Full path of command on PATH, or None if it is not installed"""
+        raise NotImplementedError
+
+    def post(self, url, body, timeout=None):
+        """POST a JSON body and return the HTTP status; raises on connection errors"""
+        raise NotImplementedError
+
+
+class SubprocessBackend(ProbeBackend):
+    """Backend that runs the real blueutil/ioreg/pgrep/osascript commands"""
+
+    def run(self, args, timeout=None, check=False):
+        return subprocess.run(args, capture_output=True, text=True,
+                              timeout=timeout, check=check)
+
+    def which(self, command):
+        return shutil.which(command)
+
+    def post(self, url, body, timeout=None):
+        import urllib.error
+        import urllib.request
+        request = urllib.request.Request(url, data=body, method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except urllib.error.URLError as e:
+            if isinstance(e.reason, TimeoutError):
+                raise subprocess.TimeoutExpired(url, timeout)
+            raise
+
+    def quartz_session(self):
+        import Quartz
+        return Quartz.CGSessionCopyCurrentDictionary()
+
+    def subscribe_screen_lock(self, callback):
+        try:
+            from Foundation import NSDistributedNotificationCenter, NSRunLoop
+        except ImportError:
+            return False
+
+        def observe():
+            center = NSDistributedNotificationCenter.defaultCenter()
+            for name, locked in (('com.apple.screenIsLocked', True),
+                                 ('com.apple.screenIsUnlocked', False)):
+                center.addObserverForName_object_queue_usingBlock_(
+                    name, None, None, lambda note, locked=locked: callback(locked))
+            # Distributed notifications are delivered on this thread's run loop
+            NSRunLoop.currentRunLoop().run()
+
+        threading.Thread(target=observe, name='screen-lock-notifications', daemon=True).start()
+        return True
+
+    async def run_async(self, args, timeout=None):
+        import asyncio
+        process = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise subprocess.TimeoutExpired(args, timeout)
+        except asyncio.CancelledError:
+            process.kill()
+            raise
+        return subprocess.CompletedProcess(args, process.returncode,
+                                           stdout.decode(errors='replace'),
+                                           stderr.decode(errors='replace'))
+
+
+def normalize_address(address):
+    """Normalize a MAC address to lowercase colon-separated form"""
+    return (address or '').replace('-', ':').lower()
+
+
+class PresenceTimeline:
+    """Scripted device presence over simulated time.
+
+    Built from (start_seconds, state[, rssi]) steps where state is one of:
+      'connected' - device in range and linked (rssi reported)
+      'dropped'   - device in range but the link dropped; --connect succeeds
+      'away'      - device out of range; --connect fails
+    """
+
+    STATES = ('connected', 'dropped', 'away')
+
+    def __init__(self, steps, departure=None):
+        self.departure = departure
+        self.steps = []
+        for step in sorted(steps, key=lambda s: s[0]):
+            state = step[1]
+            if state not in self.STATES:
+                raise ValueError(f"Unknown presence state: {state}")
+            rssi = step[2] if len(step) > 2 else -50
+            self.steps.append((float(step[0]), state, rssi))
+        self.starts = [start for start, _, _ in self.steps]
+
+    def at(self, seconds):
+        """Return (state, rssi) at the given simulated time"""
+        index = bisect.bisect_right(self.starts, seconds) - 1
+        if index < 0:
+            return ('away', None)
+        _, state, rssi = self.steps[index]
+        return (state, rssi)
+
+    def departure_time(self):
+        """First time the device leaves after having been connected"""
+        if self.departure is not None:
+            return self.departure
+        was_connected = False
+        for start, state, _ in self.steps:
+            if state == 'connected':
+                was_connected = True
+            elif was_connected:
+                return start
+        return None
+
+    @classmethod
+    def walk_away(cls, away_after, rssi=-50):
+        """Device connected from the start, gone for good after away_after"""
+        return cls([(0, 'connected', rssi), (away_after, 'away')])
+
+    @classmethod
+    def fade_away(cls, away_after, fade_seconds=20, start_rssi=-50, end_rssi=-90,
+                  noise=4, seed=1):
+        """User starts walking off at away_after; the signal fades (with
+        noisy readings) for fade_seconds before the link finally drops"""
+        rng = random.Random(seed)
+        steps = []
+        for second in range(int(away_after + fade_seconds)):
+            if second < away_after:
+                level = start_rssi
+            else:
+                level = start_rssi + (end_rssi - start_rssi) * (second - away_after) / fade_seconds
+            steps.append((second, 'connected', int(round(level + rng.uniform(-noise, noise)))))
+        steps.append((away_after + fade_seconds, 'away'))
+        return cls(steps, departure=away_after)
+
+
+class FakeBackend(ProbeBackend):
+    """Scriptable stand-in for blueutil, ioreg, pgrep, osascript and the lock command.
+
+    latency maps a probe kind ('info', 'connected', 'paired', 'connect',
+    'ioreg', 'pgrep', 'osascript', 'lock', 'media', 'webhook') to the seconds
+    that call takes on the clock; a latency larger than the call's timeout
+    raises TimeoutExpired. malformed maps a blueutil query kind to N: every
+    Nth such call prints truncated JSON. Every command is "installed":
+    which() resolves it under /usr/bin.
+    """
+
+    def __init__(self, name="SM-A536B", address="60:68:4E:E1:61:71",
+                 timeline=None, clock=None, latency=None, other_devices=None,
+                 quartz=False, notifications=False, malformed=None):
+        self.name = name
+        self.address = normalize_address(address)
+        self.timeline = timeline or PresenceTimeline([(0, 'connected')])
+        self.clock = clock or SystemClock()
+        self.latency = latency or {}
+        self.other_devices = other_devices or []
+        self.malformed = malformed or {}
+        self.query_counts = {}
+        self.quartz = quartz
+        self.notifications = notifications
+        self.screen_callback = None
+        self.screen_locked = False
+        self.reconnected_at = None
+        self.calls = []
+        self.lock_times = []
+        self.webhooks = []
+        self.started = self.clock.now()
+
+    def elapsed(self):
+        return (self.clock.now() - self.started).total_seconds()
+
+    def state(self):
+        seconds = self.elapsed()
+        state, rssi = self.timeline.at(seconds)
+        if state == 'dropped' and self.reconnected_at is not None:
+            # A successful --connect holds until the timeline changes again
+            if self.timeline.at(self.reconnected_at) == (state, rssi):
+                return 'connected', -60
+        if state != 'dropped':
+            self.reconnected_at = None
+        if state == 'connected' and self.screen_locked:
+            # The user came back and unlocked the screen
+            self.set_screen_locked(False)
+        return state, rssi
+
+    def set_screen_locked(self, locked):
+        self.screen_locked = locked
+        if self.screen_callback:
+            self.screen_callback(locked)
+
+    def _classify(self, args):
+        if args[0] == 'blueutil':
+            for flag in ('--info', '--connected', '--paired', '--connect'):
+                if flag in args:
+                    return flag[2:]
+            return 'blueutil'
+        if args[0] in ('ioreg', 'pgrep', 'osascript'):
+            return args[0]
+        if os.path.basename(args[0]) == 'osascript':
+            # Resolved by which(), so a lock action: the media pause script
+            return 'media'
+        return 'lock'
+
+    def _device_json(self, state, rssi):
+        info = {
+            'address': self.address.replace(':', '-'),
+            'name': self.name,
+            'paired': True,
+            'connected': state == 'connected',
+        }
+        if state == 'connected':
+            info['RSSI'] = rssi
+        return info
+
+    def _result(self, args, returncode, stdout='', stderr=''):
+        return subprocess.CompletedProcess(args, returncode, stdout, stderr)
+
+    def run(self, args, timeout=None, check=False):
+        kind = self._classify(args)
+        self._take(kind, args, timeout)
+        result = self._corrupt(kind, self._respond(kind, args))
+        if check and result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, args,
+                                                result.stdout, result.stderr)
+        return result
+
+    def _take(self, kind, args, timeout):
+        """Record the call and let its latency pass (raising TimeoutExpired past timeout)"""
+        self.calls.append((self.clock.now(), kind))
+        latency = self.latency.get(kind, 0.0)
+        if timeout is not None and latency > timeout:
+            self.clock.elapse(timeout)
+            raise subprocess.TimeoutExpired(args, timeout)
+        if latency:
+            self.clock.elapse(latency)
+
+    def which(self, command):
+        return command if command.startswith('/') else f"/usr/bin/{command}"
+
+    def post(self, url, body, timeout=None):
+        self._take('webhook', url, timeout)
+        self.webhooks.append((self.elapsed() + self.clock.detached_elapsed(), url, json.loads(body)))
+        return 200
+
+    async def run_async(self, args, timeout=None):
+        import asyncio
+        kind = self._classify(args)
+        self.calls.append((self.clock.now(), kind))
+        latency = self.latency.get(kind, 0.0)
+        if timeout is not None and latency > timeout:
+            await asyncio.sleep(timeout)
+            raise subprocess.TimeoutExpired(args, timeout)
+        if latency:
+            await asyncio.sleep(latency)
+        return self._corrupt(kind, self._respond(kind, args))
+
+    def _corrupt(self, kind, result):
+        """Truncate every Nth output of the kinds in self.malformed"""
+        every = self.malformed.get(kind)
+        if every:
+            count = self.query_counts[kind] = self.query_counts.get(kind, 0) + 1
+            if count % every == 0 and result.stdout:
+                result.stdout = result.stdout[:len(result.stdout) // 2]
+        return result
+
+    def _respond(self, kind, args):
+        state, rssi = self.state()
+
+        if kind == 'info':
+            device_id = args[args.index('--info') + 1]
+            if (normalize_address(device_id) == self.address or
+                    device_id.lower() == self.name.lower()):
+                return self._result(args, 0, json.dumps(self._device_json(state, rssi)))
+            return self._result(args, 1, stderr=f"Device not found: {device_id}")
+
+        if kind == 'connected':
+            devices = [self._device_json(state, rssi)] if state == 'connected' else []
+            devices += [d for d in self.other_devices if d.get('connected')]
+            return self._result(args, 0, json.dumps(devices))
+
+        if kind == 'paired':
+            devices = [self._device_json(state, rssi)] + list(self.other_devices)
+            return self._result(args, 0, json.dumps(devices))
+
+        if kind == 'connect':
+            if state == 'dropped':
+                self.reconnected_at = self.elapsed()
+                return self._result(args, 0)
+            if state == 'connected':
+                return self._result(args, 0)
+            return self._result(args, 1, stderr="Failed to connect")
+
+        if kind == 'ioreg':
+            if self.screen_locked:
+                return self._result(args, 0, "+-o IOHIDSystem\n")
+            return self._result(args, 0, '+-o IOHIDSystem\n  "HIDIdleTime" = 1000\n')
+
+        if kind == 'pgrep':
+            return self._result(args, 1)
+
+        if kind == 'osascript':
+            return self._result(args, 1 if self.screen_locked else 0)
+
+        if kind == 'lock':
+            self.set_screen_locked(True)
+            # A lock action runs detached from the monitor; it completes after its own latency
+            self.lock_times.append(self.elapsed() + self.clock.detached_elapsed())
+            return self._result(args, 0)
+
+        if kind == 'media':
+            return self._result(args, 0)
+
+        return self._result(args, 1, stderr=f"Unsupported command: {' '.join(args)}")
+
+    def subscribe_screen_lock(self, callback):
+        if not self.notifications:
+            return False
+        self.screen_callback = callback
+        return True
+
+    def quartz_session(self):
+        if not self.quartz:
+            raise ImportError("Quartz not available in FakeBackend")
+        self.calls.append((self.clock.now(), 'quartz'))
+        return {'CGSSessionScreenIsLocked': self.screen_locked}
@@ -0,0 +1,394 @@
+"""
+Lock-latency benchmark and regression suite for Mac Proximity Lock.
+
+Runs the real ProximityLock.monitor() loop against FakeBackend on a virtual
+clock and reports how long it takes to lock after the device leaves, how many
+subprocess calls each cycle makes and how long cycles take.
+
+The suite runs a fixed set of stub scenarios (slow and hung probes, a large
+paired-device list, malformed blueutil JSON) plus is_device_nearby() and
+scan_bluetooth_devices() on their own, and compares the results with
+benchmark_baseline.json: an extra subprocess per cycle, a later lock or a
+much costlier cycle fails the check.
+"""
+
+import contextlib
+import inspect
+import json
+import logging
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from backends import FakeBackend, PresenceTimeline, SimulationFinished, VirtualClock
+
+BENCH_DEVICE_NAME = "Bench Phone"
+BENCH_DEVICE_MAC = "60:68:4E:E1:61:71"
+
+PROBE_KINDS = ('info', 'connected', 'paired', 'connect', 'ioreg', 'pgrep', 'osascript', 'lock', 'media', 'webhook')
+
+BASELINE_FILE = Path(__file__).with_name('benchmark_baseline.json')
+
+# The harness's own bookkeeping (FakeBackend's call log, CycleRecorder's
+# lists) grows every cycle; it is left out of the per-cycle memory figures
+HARNESS_FILTERS = (tracemalloc.Filter(False, __file__),
+                   tracemalloc.Filter(False, inspect.getfile(FakeBackend)))
+
+# Traced runs of the suite keep this many cycles in the trace buffer, so it
+# and the timings kept for the control socket fill up early in the run
+TRACED_TRACE_SIZE = 50
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class CycleRecorder:
+    """Collects per-cycle figures from VirtualClock.sleep callbacks"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.cycle_start = 0.0
+        self.calls_at_start = 0
+        self.cpu_at_start = time.process_time()
+        self.durations = []
+        self.calls = []
+        self.cpu = []
+        # Traced memory held by the monitor at the end of each cycle (only while tracemalloc runs)
+        self.memory = []
+
+    def on_sleep(self, offset, seconds):
+        cpu_now = time.process_time()
+        self.durations.append(offset - self.cycle_start)
+        self.calls.append(len(self.backend.calls) - self.calls_at_start)
+        self.cpu.append(cpu_now - self.cpu_at_start)
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces(HARNESS_FILTERS)
+            self.memory.append(sum(trace.size for trace in snapshot.traces))
+        self.cycle_start = offset + seconds
+        self.calls_at_start = len(self.backend.calls)
+        self.cpu_at_start = cpu_now
+
+
+@contextlib.contextmanager
+def simulated_lock(config, backend, clock):
+    """A silenced ProximityLock on backend and clock, with config in a temporary file"""
+    from main import ProximityLock
+
+    # A handler on the root logger turns setup_logging() into a no-op so a
+    # simulation neither prints per-cycle lines nor writes proximity_lock.log
+    root = logging.getLogger()
+    null_handler = logging.NullHandler()
+    root.addHandler(null_handler)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            config_path = Path(tmp) / 'config.json'
+            with open(config_path, 'w') as f:
+                json.dump(config, f)
+            lock = ProximityLock(config_path, backend=backend, clock=clock)
+            lock.logger.setLevel(logging.CRITICAL + 1)
+            yield lock
+    finally:
+        root.removeHandler(null_handler)
+
+
+def simulate(config, backend, clock, engine='sync'):
+    """Run the monitor against backend on clock until the clock ends; returns the ProximityLock"""
+    with simulated_lock(config, backend, clock) as lock:
+        try:
+            if engine == 'async':
+                from async_engine import run_async_monitor
+                run_async_monitor(lock)
+            else:
+                lock.monitor()
+        except SimulationFinished:
+            pass
+    return lock
+
+
+def run_engine_benchmark(config, steps=200000, away_every=600, away_for=120):
+    """Time DecisionEngine.step() alone over a synthetic come-and-go pattern (config must be complete)"""
+    import decision
+
+    engine = decision.DecisionEngine(config, 0.0)
+    period = away_every + away_for
+    rssi_pattern = [-50 - (i % 7) for i in range(period)]
+    locks = 0
+    started = time.perf_counter()
+    for i in range(steps):
+        phase = i % period
+        connected = phase < away_every
+        screen_locked = engine.locked if engine.needs_screen_state(connected) else None
+        actions = engine.step(float(i), True, connected, True, rssi_pattern[phase], screen_locked)
+        if actions & decision.LOCK:
+            engine.locked = True
+            locks += 1
+    elapsed = time.perf_counter() - started
+    return {'steps': steps, 'locks': locks, 'step_us': elapsed / steps * 1e6}
+
+
+def run_benchmark(base_config=None, away_after=60.0, linger=60.0, latency=0.2, timeline=None,
+                  engine='sync', fake_options=None, fade=0, engine_steps=200000):
+    """Run monitor() against the fake backend and return a results dict.
+
+    Under tracemalloc, the results also give the peak traced memory and the
+    median growth per cycle (so one-off fills like the paired-device cache
+    don't count, but something kept every cycle does). Growth is only taken
+    once the bounded buffers (recent cycle timings, the cycle trace) are
+    full, and leaves out the harness's own allocations.
+    """
+    config = dict(base_config or {})
+    config['device_name'] = BENCH_DEVICE_NAME
+    config['device_mac'] = BENCH_DEVICE_MAC
+    config['devices'] = []
+    timeout = config.get('timeout_seconds', 30)
+
+    if timeline is None:
+        if fade:
+            timeline = PresenceTimeline.fade_away(away_after, fade_seconds=fade)
+        else:
+            timeline = PresenceTimeline.walk_away(away_after)
+    departure = timeline.departure_time()
+    clock = VirtualClock(end_after=(departure or away_after) + timeout + linger)
+    latency_map = latency if isinstance(latency, dict) else dict.fromkeys(PROBE_KINDS, latency)
+    backend = FakeBackend(name=BENCH_DEVICE_NAME, address=BENCH_DEVICE_MAC,
+                          timeline=timeline, clock=clock, latency=latency_map,
+                          **(fake_options or {}))
+    recorder = CycleRecorder(backend)
+    clock.on_sleep = recorder.on_sleep
+    lock = simulate(config, backend, clock, engine)
+
+    screen = lock.screen_state.stats()
+    time_to_lock = None
+    if departure is not None:
+        locks_after = [t for t in backend.lock_times if t >= departure]
+        if locks_after:
+            time_to_lock = locks_after[0] - departure
+
+    from main import RECENT_CYCLES
+    memory = recorder.memory[max(RECENT_CYCLES, lock.config['trace_size']):]
+    return {
+        'cycles': len(recorder.durations),
+        'timeout_seconds': timeout,
+        'departure': departure,
+        'time_to_lock': time_to_lock,
+        'lock_delay': None if time_to_lock is None else time_to_lock - timeout,
+        'locks': len(backend.lock_times),
+        'calls_total': len(backend.calls),
+        'calls_per_cycle_mean': (sum(recorder.calls) / len(recorder.calls)) if recorder.calls else 0.0,
+        'calls_per_cycle_max': max(recorder.calls) if recorder.calls else 0,
+        'cycle_p50': percentile(recorder.durations, 50),
+        'cycle_p90': percentile(recorder.durations, 90),
+        'cycle_p99': percentile(recorder.durations, 99),
+        'cycle_max': max(recorder.durations) if recorder.durations else 0.0,
+        'cpu_per_cycle_ms': (sum(recorder.cpu) / len(recorder.cpu) * 1000) if recorder.cpu else 0.0,
+        'screen_method': screen['method'],
+        'screen_probes': screen['probes'],
+        'screen_probe_seconds': screen['probe_seconds'],
+        'screen_cache_hits': screen['cache_hits'],
+        'probe_summary': lock.metrics.summary(),
+        'alloc_peak_kb': tracemalloc.get_traced_memory()[1] / 1024 if tracemalloc.is_tracing() else None,
+        'alloc_growth_per_cycle': percentile([b - a for a, b in zip(memory, memory[1:])], 50) if len(memory) > 1 else None,
+        'engine': run_engine_benchmark(lock.config, engine_steps) if engine_steps else None,
+    }
+
+
+def format_report(results):
+    """Render benchmark results for the terminal"""
+    lines = ["=== Mac Proximity Lock Benchmark ==="]
+    lines.append(f"Cycles simulated:       {results['cycles']}")
+    if results['time_to_lock'] is None:
+        lines.append("Time to lock:           never locked")
+    else:
+        lines.append(f"Time to lock:           {results['time_to_lock']:.1f}s after departure "
+                     f"(timeout {results['timeout_seconds']}s, {results['lock_delay']:+.1f}s)")
+    lines.append(f"Subprocess calls/cycle: mean {results['calls_per_cycle_mean']:.2f} | "
+                 f"max {results['calls_per_cycle_max']} | total {results['calls_total']}")
+    lines.append(f"Cycle duration:         p50 {results['cycle_p50']:.2f}s | "
+                 f"p90 {results['cycle_p90']:.2f}s | p99 {results['cycle_p99']:.2f}s | "
+                 f"max {results['cycle_max']:.2f}s")
+    lines.append(f"CPU per cycle:          {results['cpu_per_cycle_ms']:.3f}ms")
+    lines.append(f"Screen-lock probes:     {results['screen_probes']} ({results['screen_probe_seconds']:.2f}s) | "
+                 f"cache hits {results['screen_cache_hits']} | method {results['screen_method']}")
+    if results['probe_summary']:
+        for entry in results['probe_summary'].split(" | "):
+            label = "Probe latency:" if " p50≤" in entry else "Probe events:"
+            lines.append(f"{label:<24}{entry}")
+    engine = results['engine']
+    if engine:
+        lines.append(f"Decision engine:        {engine['step_us']:.2f}µs/step over {engine['steps']:,} steps "
+                     f"({engine['locks']} locks)")
+    return "\n".join(lines)
+
+
+def stub_devices(count, connected=0):
+    """A long --paired list: count other devices, the first `connected` of them connected"""
+    devices = []
+    for i in range(count):
+        device = {'address': f"10-00-00-00-{i // 256:02x}-{i % 256:02x}", 'name': f"Stub Device {i}",
+                  'paired': True, 'connected': i < connected}
+        if i < connected:
+            device['RSSI'] = -70
+        devices.append(device)
+    return devices
+
+
+HUNG = 60
+
+# Regression suite scenarios: run_benchmark() keyword arguments on the default config
+SUITE_SCENARIOS = {
+    'walk_away': {},
+    'slow_probes': {'latency': 1.5},
+    'hung_connected_query': {'latency': dict(dict.fromkeys(PROBE_KINDS, 0.2), connected=HUNG)},
+    'hung_screen_probes': {'latency': dict(dict.fromkeys(PROBE_KINDS, 0.2), ioreg=HUNG, pgrep=HUNG, osascript=HUNG)},
+    'large_paired_list': {'fake_options': {'other_devices': stub_devices(500, connected=20)}},
+    'malformed_json': {'fake_options': {'malformed': {'connected': 3, 'paired': 2, 'info': 2}}},
+    'async_walk_away': {'engine': 'async'},
+    'async_hung_connected_query': {'engine': 'async',
+                                   'latency': dict(dict.fromkeys(PROBE_KINDS, 0.2), connected=HUNG)},
+}
+
+# Lookups timed outside the monitor loop: FakeBackend options
+LOOKUP_SCENARIOS = {
+    'large_paired_list': {'other_devices': stub_devices(500, connected=20)},
+    'malformed_json': {'other_devices': stub_devices(50), 'malformed': {'connected': 3, 'paired': 2}},
+}
+
+SUITE_METRICS = ('time_to_lock', 'locks', 'calls_per_cycle_mean', 'calls_per_cycle_max', 'cycle_max',
+                 'cpu_per_cycle_ms', 'alloc_peak_kb', 'alloc_growth_per_cycle')
+
+# How far a metric may rise above its baseline: ('plus', amount) or ('times', factor).
+# Virtual-time and call-count metrics are deterministic; CPU and memory vary by machine.
+SUITE_CHECKS = {
+    'time_to_lock': ('plus', 1.0),
+    'locks': ('plus', 0),
+    'calls_per_cycle_mean': ('plus', 0.25),
+    'calls_per_cycle_max': ('plus', 0),
+    'cycle_max': ('plus', 0.5),
+    'cpu_per_cycle_ms': ('times', 3.0),
+    'alloc_peak_kb': ('times', 1.5),
+    'alloc_growth_per_cycle': ('plus', 2048),
+    'spawns_per_call': ('plus', 0.1),
+    'cpu_us_per_call': ('times', 3.0),
+}
+
+
+def run_lookup_benchmark(fake_options=None, calls=200, interval=5.0):
+    """Time is_device_nearby() and scan_bluetooth_devices() on their own, interval virtual seconds apart"""
+    clock = VirtualClock()
+    backend = FakeBackend(name=BENCH_DEVICE_NAME, address=BENCH_DEVICE_MAC, clock=clock,
+                          **(fake_options or {}))
+    config = {'device_name': BENCH_DEVICE_NAME, 'device_mac': BENCH_DEVICE_MAC}
+    results = {}
+    with simulated_lock(config, backend, clock) as lock:
+        for name, lookup in (('is_device_nearby', lock.is_device_nearby),
+                             ('scan_bluetooth_devices', lock.scan_bluetooth_devices)):
+            calls_before = len(backend.calls)
+            started = time.process_time()
+            for _ in range(calls):
+                lookup()
+                clock.elapse(interval)
+            cpu = time.process_time() - started
+            spawned = len(backend.calls) - calls_before
+
+            tracemalloc.start()
+            lookup()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[name] = {
+                'cpu_us_per_call': cpu / calls * 1e6,
+                'spawns_per_call': spawned / calls,
+                'alloc_peak_kb': peak / 1024,
+            }
+    return results
+
+
+def run_suite(repeat=3):
+    """Run every suite scenario; returns {scenario: {metric: value}}"""
+    results = {}
+    for name, options in SUITE_SCENARIOS.items():
+        runs = [run_benchmark({}, engine_steps=0, **options) for _ in range(repeat)]
+        # Allocations come from a separate run, as tracing slows everything
+        # down; it lingers long enough to measure growth after the buffers fill
+        tracemalloc.start()
+        try:
+            traced = run_benchmark({'trace_size': TRACED_TRACE_SIZE}, engine_steps=0,
+                                   **dict(options, linger=900.0))
+        finally:
+            tracemalloc.stop()
+        result = {metric: runs[0][metric] for metric in SUITE_METRICS}
+        result['cpu_per_cycle_ms'] = min(run['cpu_per_cycle_ms'] for run in runs)
+        result['alloc_peak_kb'] = traced['alloc_peak_kb']
+        result['alloc_growth_per_cycle'] = traced['alloc_growth_per_cycle']
+        results[name] = result
+
+    for name, fake_options in LOOKUP_SCENARIOS.items():
+        for lookup, result in run_lookup_benchmark(fake_options).items():
+            results[f"{lookup}:{name}"] = result
+    return results
+
+
+def check_baseline(results, baseline):
+    """Regressions of results against a baseline from the same suite, as messages"""
+    regressions = []
+    for name, expected in baseline.items():
+        if name not in results:
+            regressions.append(f"{name}: scenario missing")
+            continue
+        for metric, base in expected.items():
+            value = results[name].get(metric)
+            if metric not in SUITE_CHECKS or base is None:
+                continue
+            if value is None:
+                regressions.append(f"{name} {metric}: none (baseline {base:g})")
+                continue
+            how, amount = SUITE_CHECKS[metric]
+            limit = base + amount if how == 'plus' else base * amount
+            if value > limit + 1e-9:
+                allowed = f"+{amount:g}" if how == 'plus' else f"x{amount:g}"
+                regressions.append(f"{name} {metric}: {value:.3f} > baseline {base:.3f} ({allowed} allowed)")
+    return regressions
+
+
+def load_baseline(path=BASELINE_FILE):
+    with open(path) as f:
+        return json.load(f)['scenarios']
+
+
+def save_baseline(results, path=BASELINE_FILE):
+    with open(path, 'w') as f:
+        rounded = {name: {metric: round(value, 4) if isinstance(value, float) else value
+                          for metric, value in result.items()}
+                   for name, result in results.items()}
+        json.dump({'scenarios': rounded}, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def format_suite(results):
+    """Render suite results for the terminal"""
+    lines = ["=== Mac Proximity Lock Regression Suite ==="]
+    lines.append(f"{'Scenario':<28}{'Lock':>8}{'Calls/cycle':>14}{'Cycle max':>11}{'CPU/cycle':>11}"
+                 f"{'Alloc peak':>12}{'Growth/cycle':>14}")
+    for name, result in results.items():
+        if 'calls_per_cycle_mean' not in result:
+            continue
+        lock = "never" if result['time_to_lock'] is None else f"{result['time_to_lock']:.1f}s"
+        growth = result['alloc_growth_per_cycle']
+        lines.append(f"{name:<28}{lock:>8}"
+                     f"{result['calls_per_cycle_mean']:>9.2f} (≤{result['calls_per_cycle_max']})"
+                     f"{result['cycle_max']:>10.2f}s{result['cpu_per_cycle_ms']:>9.3f}ms"
+                     f"{result['alloc_peak_kb']:>10.0f}KB{'-' if growth is None else f'{growth:.0f}B':>14}")
+    lines.append("")
+    lines.append(f"{'Lookup':<48}{'CPU/call':>12}{'Calls/call':>12}{'Alloc peak':>12}")
+    for name, result in results.items():
+        if 'cpu_us_per_call' not in result:
+            continue
+        lines.append(f"{name:<48}{result['cpu_us_per_call']:>10.1f}µs{result['spawns_per_call']:>12.2f}"
+                     f"{result['alloc_peak_kb']:>10.0f}KB")
+    return "\n".join(lines)
@@ -44,6 +44,12 @@ case "$1" in
         ;;
     
     "status")
+        # Ask the running monitor first: it answers from memory without another Bluetooth scan
+        SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
+        if [ -S "$SCRIPT_DIR/proximity_lock.sock" ] && python3 "$SCRIPT_DIR/main.py" --config "$SCRIPT_DIR/config.json" --status; then
+            exit 0
+        fi
+        
         echo "📊 Bluetooth Status:"
         echo "Power: $(blueutil --power)"
         echo "Discoverable: $(blueutil --discoverable)"
@@ -104,7 +110,7 @@ case "$1" in
         echo "  reset                    - Reset Bluetooth stack"
         echo "  connect <address>        - Connect to device"
         echo "  disconnect <address>     - Disconnect from device"  
-        echo "  status                   - Show Bluetooth status"
+        echo "  status                   - Show monitor status (or Bluetooth status if it isn't running)"
         echo "  pair <address>          - Pair with device"
         echo "  scan                    - Scan for nearby devices"
         echo "  auto-reconnect <address> - Monitor and auto-reconnect"
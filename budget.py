@@ -0,0 +1,104 @@
+"""
+Per-cycle time budget for Mac Proximity Lock.
+
+Every probe has its own timeout (5 s per blueutil scan, 3 s per `--info`
+lookup, 2-3 s per screen check) and in a bad cycle they add up to more than
+the lock timeout itself. CycleBudget gives the whole cycle one deadline,
+cycle_budget_seconds after it starts. BudgetedBackend clamps each probe's
+timeout to the time left and skips probes outright once almost nothing is
+left, so the lock decision is always made within the budget. The device
+lookups may only use part of it; the rest is kept for the screen-lock check
+the decision may need.
+"""
+
+import subprocess
+from datetime import timedelta
+
+from backends import ProbeBackend
+
+# Share of the budget kept back from the device lookups for the decision phase
+DECIDE_RESERVE = 0.25
+# Probes are skipped rather than started with less time than this
+MIN_PROBE_SECONDS = 0.25
+
+
+class BudgetExhausted(subprocess.TimeoutExpired):
+    """Raised instead of running a probe when the cycle has no time left for it"""
+
+
+class CycleBudget:
+    """Deadline for the current monitor cycle (no deadline outside cycles or when seconds is 0)"""
+
+    def __init__(self, clock, seconds=0):
+        self.clock = clock
+        self.seconds = seconds
+        self.deadline = None
+        self.lookup_deadline = None
+        self.phase_deadline = None
+        self.skipped = 0
+        self.cut_short = 0
+
+    def start(self):
+        """Begin a cycle in its lookup phase"""
+        self.skipped = 0
+        self.cut_short = 0
+        if not self.seconds:
+            self.deadline = self.lookup_deadline = self.phase_deadline = None
+            return
+        now = self.clock.now()
+        self.deadline = now + timedelta(seconds=self.seconds)
+        self.lookup_deadline = now + timedelta(seconds=self.seconds * (1 - DECIDE_RESERVE))
+        self.phase_deadline = self.lookup_deadline
+
+    def decide(self):
+        """Lookups are done: the decision phase may use the rest of the budget"""
+        self.phase_deadline = self.deadline
+
+    def finish(self):
+        """End the cycle; probes outside a cycle run with their own timeouts"""
+        self.deadline = self.lookup_deadline = self.phase_deadline = None
+
+    def remaining(self):
+        """Seconds left in the current phase, or None without a deadline"""
+        if self.phase_deadline is None:
+            return None
+        return max(0.0, (self.phase_deadline - self.clock.now()).total_seconds())
+
+    def clamp(self, args, timeout):
+        """The timeout to run a probe with; raises BudgetExhausted if it should be skipped"""
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if remaining < MIN_PROBE_SECONDS:
+            self.skipped += 1
+            raise BudgetExhausted(args, 0)
+        if timeout is None or remaining < timeout:
+            self.cut_short += 1
+            return remaining
+        return timeout
+
+
+class BudgetedBackend(ProbeBackend):
+    """Wraps a backend so every command's timeout is bounded by the cycle budget"""
+
+    def __init__(self, backend, budget):
+        self.backend = backend
+        self.budget = budget
+
+    def run(self, args, timeout=None, check=False):
+        return self.backend.run(args, timeout=self.budget.clamp(args, timeout), check=check)
+
+    async def run_async(self, args, timeout=None):
+        return await self.backend.run_async(args, timeout=self.budget.clamp(args, timeout))
+
+    def quartz_session(self):
+        return self.backend.quartz_session()
+
+    def subscribe_screen_lock(self, callback):
+        return self.backend.subscribe_screen_lock(callback)
+
+    def which(self, command):
+        return self.backend.which(command)
+
+    def post(self, url, body, timeout=None):
+        return self.backend.post(url, body, timeout=self.budget.clamp(url, timeout))
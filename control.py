@@ -0,0 +1,140 @@
+"""
+Local control socket for Mac Proximity Lock.
+
+The running monitor listens on a Unix domain socket and answers queries
+from memory (status, device table, countdown, recent cycle timings) and
+accepts commands (lock, pause, resume, reload). `metrics` returns the
+Prometheus text also served on metrics_port, `trace` the recent per-cycle
+status lines. The protocol is one JSON object per line in each direction,
+one request per connection, e.g.
+
+    echo '{"command": "status"}' | nc -U proximity_lock.sock
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = "proximity_lock.sock"
+
+
+def socket_path_for(config_path, config=None):
+    """Control socket path; relative paths are resolved next to the config file"""
+    config_path = Path(config_path)
+    if config is None:
+        try:
+            with open(config_path, 'r') as f:
+                config = json.load(f)
+        except (OSError, ValueError):
+            config = {}
+    path = Path(config.get('control_socket') or DEFAULT_SOCKET)
+    if not path.is_absolute():
+        path = config_path.resolve().parent / path
+    return path
+
+
+def request(path, command, timeout=1.0, **params):
+    """Send one command to a running monitor. Returns its reply, or None if none is running"""
+    message = dict(params, command=command)
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(str(path))
+            sock.sendall(json.dumps(message).encode() + b"\n")
+            with sock.makefile('rb') as reader:
+                line = reader.readline()
+    except (OSError, socket.timeout):
+        return None
+    if not line:
+        return None
+    return json.loads(line)
+
+
+class ControlServer:
+    """Serves a ProximityLock's in-memory state over a Unix domain socket"""
+
+    def __init__(self, lock, path):
+        self.lock = lock
+        self.path = Path(path)
+        self.server = None
+        self.commands = {
+            'status': lambda message: lock.status_snapshot(),
+            'devices': lambda message: {'devices': lock.device_table()},
+            'countdown': lambda message: lock.countdown(),
+            'timings': lambda message: {'cycles': list(lock.cycle_timings)},
+            'metrics': lambda message: {'text': lock.render_metrics()},
+            'trace': lambda message: {'text': "".join(f"{line}\n" for line in lock.trace_lines())},
+            'lock': lambda message: lock.force_lock(),
+            'pause': lambda message: lock.set_paused(True),
+            'resume': lambda message: lock.set_paused(False),
+            'reload': lambda message: lock.request_reload(),
+        }
+
+    def dispatch(self, command, message):
+        handler = self.commands.get(command)
+        if handler is None:
+            return {'ok': False, 'error': f"Unknown command: {command}",
+                    'commands': sorted(self.commands)}
+        reply = handler(message) or {}
+        reply.setdefault('ok', True)
+        return reply
+
+    def start(self):
+        """Start serving in a background thread. Returns False if another monitor owns the socket"""
+        if self.path.exists():
+            if request(self.path, 'status') is not None:
+                logger.error(f"Another monitor is already listening on {self.path}")
+                return False
+            # Stale socket left behind by a monitor that didn't shut down cleanly
+            self.path.unlink()
+
+        # Imported here so CLI clients (--status, --list-devices) start fast
+        import socketserver
+
+        class Handler(socketserver.StreamRequestHandler):
+            timeout = 5
+
+            def handle(self):
+                # One request per connection, so `echo ... | nc -U` works as a client
+                line = self.rfile.readline()
+                if not line.strip():
+                    return
+                try:
+                    message = json.loads(line)
+                    reply = self.server.control.dispatch(message.get('command', ''), message)
+                except (ValueError, AttributeError) as e:
+                    reply = {'ok': False, 'error': f"Bad request: {e}"}
+                except Exception as e:
+                    logger.error(f"Control command failed: {e}")
+                    reply = {'ok': False, 'error': str(e)}
+                self.wfile.write(json.dumps(reply, default=str).encode() + b"\n")
+
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        try:
+            self.server = Server(str(self.path), Handler)
+        except OSError as e:
+            logger.error(f"Could not open control socket {self.path}: {e}")
+            return False
+        self.server.control = self
+        os.chmod(self.path, 0o600)
+        threading.Thread(target=self.server.serve_forever, name='control-socket', daemon=True).start()
+        logger.info(f"🎛️  Control socket listening on {self.path}")
+        return True
+
+    def stop(self):
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,214 @@
+"""
+Lock decision state machine for Mac Proximity Lock.
+
+DecisionEngine holds everything the monitor decides with (when the device
+was last seen, whether we locked, the reconnect attempt count, each
+device's RSSI trend) and turns one cycle's observation plus a clock value
+into a bitmask of actions. It does no I/O and allocates nothing per step
+beyond floats, so the driver (ProximityLock.run_cycle) does the probing,
+logging and subprocess work, and simulations can run it for millions of
+steps.
+"""
+
+from rssi import RssiHistory, DeparturePredictor
+
+# Actions for the driver to carry out
+RESCAN = 0x001             # look the device up again right away instead of sleeping
+LOCK = 0x002               # lock the screen now
+RECONNECT = 0x004          # start reconnecting in the background
+RECONNECT_NOW = 0x008      # reconnect immediately (user is back at the desk)
+CANCEL_RECONNECT = 0x010   # stop any reconnect attempts
+
+# State transitions, for logging
+DEVICE_RETURNED = 0x020    # link is back after being down
+DEVICE_LEFT = 0x040        # link just dropped
+DEPARTURE_PREDICTED = 0x080
+DEPARTURE_CANCELLED = 0x100
+UNLOCK_ASSUMED = 0x200     # signal recovered while locked
+MANUAL_UNLOCK = 0x400      # screen was unlocked while we thought it locked
+FALSE_ALARM = 0x800        # ...while only a departure had been predicted
+TIMEOUT = 0x1000           # away for at least the lock timeout
+
+
+class DecisionEngine:
+    """Pure per-cycle lock/reconnect/unlock decisions for the target device"""
+
+    __slots__ = ('timeout_seconds', 'early_lock', 'early_lock_timeout', 'max_attempts',
+                 'auto_reconnect', 'history_size', 'rssi_smoothing', 'histories', 'history',
+                 'predictor', 'last_seen', 'locked',
+                 'last_connected', 'departure_predicted_at', 'reconnect_attempts',
+                 'departing', 'elapsed', 'timeout')
+
+    def __init__(self, config, now):
+        self.history = None
+        self.configure(config)
+        self.reset(now)
+        self.locked = False
+
+    def configure(self, config):
+        self.timeout_seconds = config['timeout_seconds']
+        self.early_lock = config['early_lock']
+        self.early_lock_timeout = config['early_lock_timeout']
+        self.max_attempts = config['max_reconnect_attempts']
+        self.auto_reconnect = config.get('auto_reconnect', True)
+        self.predictor = DeparturePredictor(
+            slope_threshold=config['early_lock_slope'],
+            rssi_threshold=config['early_lock_rssi'],
+            window_seconds=config['early_lock_window']
+        )
+        if (self.history is None or self.history_size != config['rssi_history_size'] or
+                self.rssi_smoothing != config['rssi_smoothing']):
+            self.history_size = config['rssi_history_size']
+            self.rssi_smoothing = config['rssi_smoothing']
+            # One history per device address; history is the one the last
+            # decision was made on
+            self.histories = {}
+            self.history = self.history_for('')
+
+    def reset(self, now):
+        """Forget the connection state and restart the away clock (e.g. after a pause)"""
+        self.last_seen = now
+        self.last_connected = None
+        self.departure_predicted_at = None
+        self.reconnect_attempts = 0
+        self.departing = False
+        self.elapsed = 0.0
+        self.timeout = self.timeout_seconds
+        for history in self.histories.values():
+            history.clear()
+
+    def current_timeout(self):
+        """Lock timeout in effect: shortened while a departure is predicted"""
+        if self.departure_predicted_at is not None:
+            return self.early_lock_timeout
+        return self.timeout_seconds
+
+    def away_seconds(self, now):
+        return now - self.last_seen
+
+    def needs_screen_state(self, connected):
+        """Whether step() will use the screen-lock state, so the driver only probes when it matters"""
+        return self.locked and (not connected or self.departure_predicted_at is not None)
+
+    def history_for(self, address):
+        """The RSSI history of the device at address, created on first use"""
+        history = self.histories.get(address)
+        if history is None:
+            history = self.histories[address] = RssiHistory(self.history_size, self.rssi_smoothing)
+        return history
+
+    def sample(self, now, address, rssi):
+        """Feed the RSSI of a connected device the decision is not made on, so
+        its trend is current if it takes over"""
+        if isinstance(rssi, (int, float)):
+            self.history_for(address).add(now, rssi)
+
+    def forget(self, address):
+        """Drop a disconnected device's samples; its trend starts over when it is back"""
+        history = self.histories.get(address)
+        if history is not None:
+            history.clear()
+
+    def _track_rssi(self, now, rssi):
+        """Feed the deciding device's RSSI history; returns (departing, actions)"""
+        if isinstance(rssi, (int, float)):
+            self.history.add(now, rssi)
+        if not self.early_lock:
+            return False, 0
+
+        actions = 0
+        if self.departure_predicted_at is None:
+            if self.predictor.is_departing(self.history):
+                self.departure_predicted_at = now
+                actions = DEPARTURE_PREDICTED
+        elif self.predictor.has_recovered(self.history):
+            self.departure_predicted_at = None
+            actions = DEPARTURE_CANCELLED
+            if self.locked:
+                self.locked = False
+                actions |= UNLOCK_ASSUMED
+        return self.departure_predicted_at is not None, actions
+
+    def step(self, now, found, connected, paired, rssi=None, screen_locked=None,
+             reconnected=False, failed_attempt=0, reconnecting=False, address=''):
+        """Decide one cycle.
+
+        now is the clock in seconds; found/connected/paired/rssi describe
+        this cycle's device lookup; screen_locked is the probed lock state
+        (None if not probed, see needs_screen_state()); reconnected,
+        failed_attempt and reconnecting report the background reconnects;
+        address identifies the device, whose RSSI history the trend is
+        predicted from.
+        Returns a bitmask of the action and transition flags above.
+        """
+        actions = 0
+        self.history = self.history_for(address)
+        if failed_attempt:
+            self.reconnect_attempts = failed_attempt
+        if reconnected:
+            self.last_seen = now
+            self.reconnect_attempts = 0
+            if not connected:
+                # This cycle's lookup predates the reconnect - look again right away
+                return RESCAN
+
+        if self.last_connected is not None:
+            if not self.last_connected and connected:
+                actions |= DEVICE_RETURNED | CANCEL_RECONNECT
+                self.locked = False
+                self.departure_predicted_at = None
+                self.history.clear()
+                self.reconnect_attempts = 0
+            elif self.last_connected and not connected:
+                actions |= DEVICE_LEFT
+        self.last_connected = connected
+
+        departing = False
+        if connected:
+            departing, trend = self._track_rssi(now, rssi)
+            actions |= trend
+        self.departing = departing
+
+        if connected and not departing:
+            self.last_seen = now
+            self.elapsed = 0.0
+            return actions
+
+        elapsed = now - self.last_seen
+        timeout = self.current_timeout()
+        self.elapsed = elapsed
+        self.timeout = timeout
+        disconnected_pair = found and paired and not connected
+
+        if self.locked and screen_locked is False:
+            actions |= MANUAL_UNLOCK
+            self.locked = False
+            if departing:
+                # The predicted departure was a false alarm; need a fresh trend to predict again
+                self.departure_predicted_at = None
+                self.history.clear()
+                self.last_seen = now
+                self.departing = False
+                return actions | FALSE_ALARM
+            if disconnected_pair and self.auto_reconnect:
+                # The user is back: give the reconnect a full timeout instead
+                # of locking again while it runs
+                actions |= RECONNECT_NOW
+                self.reconnect_attempts = 0
+                self.last_seen = now
+                elapsed = self.elapsed = 0.0
+
+        if (disconnected_pair and self.auto_reconnect and
+                self.reconnect_attempts < self.max_attempts and
+                elapsed < timeout and
+                not reconnecting and not actions & RECONNECT_NOW):
+            actions |= RECONNECT
+
+        if elapsed >= timeout:
+            actions |= TIMEOUT
+            if self.reconnect_attempts > 0 or reconnecting:
+                actions |= CANCEL_RECONNECT
+                self.reconnect_attempts = 0
+            if not self.locked:
+                actions |= LOCK
+        return actions
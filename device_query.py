@@ -0,0 +1,267 @@
+"""
+Batched Bluetooth queries for Mac Proximity Lock.
+
+One `blueutil --connected` call per cycle answers "is each trusted device
+linked and at what RSSI". The paired-device list almost never changes, so it
+is cached and only re-read with `blueutil --paired` once its TTL has expired.
+Both are indexed by normalized MAC (and lowercased name), so resolving every
+trusted device costs one dict lookup each, however many are configured.
+"""
+
+import collections
+import json
+import logging
+import subprocess
+
+from backends import normalize_address
+
+logger = logging.getLogger(__name__)
+
+
+def device_record(raw, connected):
+    """Convert a blueutil JSON device into the dict ProximityLock works with"""
+    name = raw.get('name') or 'Unknown'
+    return {
+        'name': name,
+        'address': normalize_address(raw.get('address', '')),
+        'connected': connected,
+        'rssi': raw.get('RSSI', 'N/A') if connected else 'N/A',
+        'type': 'Mobile Phone' if 'phone' in name.lower() else 'Unknown',
+        'paired': True,
+    }
+
+
+# A trusted device as configured: normalized MAC, name as written, its
+# lowercased match key and the MAC in the form `blueutil --info` takes
+# (MAC or name may be empty)
+Target = collections.namedtuple('Target', 'mac name key blueutil_mac')
+
+PRESENCE_POLICIES = ('any', 'all')
+
+
+def configured_targets(config):
+    """Trusted devices from config: device_name/device_mac plus the `devices` list, without duplicates"""
+    entries = [{'name': config.get('device_name'), 'mac': config.get('device_mac')}]
+    entries += config.get('devices') or []
+    targets = {}
+    for entry in entries:
+        name = entry.get('name') or ''
+        mac = normalize_address(entry.get('mac'))
+        target = Target(mac, name, name.lower(), mac.replace(':', '-'))
+        if target.mac or target.key:
+            targets.setdefault((target.mac, target.key), target)
+    return list(targets.values())
+
+
+def combine_presence(devices, policy='any'):
+    """Collapse per-target lookups into the one device the lock decision is made on.
+
+    "any": the strongest connected device, else a paired one to reconnect.
+    "all": the weakest connected device while all are connected, else the
+    first one that is missing (None if it is not even paired).
+    """
+    connected = [device for device in devices if device and device['connected']]
+    if policy == 'all':
+        if len(connected) < len(devices):
+            return next(device for device in devices if not (device and device['connected']))
+        return min(connected, key=_rssi_value) if connected else None
+    if connected:
+        return max(connected, key=_rssi_value)
+    return next((device for device in devices if device and device['paired']),
+                next((device for device in devices if device), None))
+
+
+def _rssi_value(device):
+    rssi = device.get('rssi')
+    return rssi if isinstance(rssi, (int, float)) else -128
+
+
+def index_names(devices):
+    """Lowercased name -> address for a MAC-keyed device index"""
+    return {device['name'].lower(): address for address, device in devices.items()}
+
+
+class QueryFailed(Exception):
+    """Raised when blueutil could not be queried this cycle"""
+
+
+class QueryTimeout(QueryFailed):
+    """Raised when the blueutil query ran past its timeout"""
+
+
+class PairedDeviceCache:
+    """Paired-device index keyed by normalized MAC, refreshed after ttl seconds"""
+
+    def __init__(self, backend, clock, ttl=300):
+        self.backend = backend
+        self.clock = clock
+        self.ttl = ttl
+        self.devices = {}
+        self.names = {}
+        self.refreshed_at = None
+
+    def is_stale(self):
+        if self.refreshed_at is None:
+            return True
+        return (self.clock.now() - self.refreshed_at).total_seconds() >= self.ttl
+
+    def refresh(self):
+        """Re-read the paired list with a single blueutil call"""
+        return self._store(run_blueutil_json(self.backend, '--paired'))
+
+    async def refresh_async(self):
+        return self._store(await run_blueutil_json_async(self.backend, '--paired'))
+
+    def _store(self, raw_devices):
+        self.devices = {}
+        for raw in raw_devices:
+            record = device_record(raw, connected=False)
+            self.devices[record['address']] = record
+        self.names = index_names(self.devices)
+        self.refreshed_at = self.clock.now()
+        logger.debug(f"Paired device cache refreshed: {len(self.devices)} devices")
+        return self.devices
+
+    def get(self, force=False):
+        if force or self.is_stale():
+            self.refresh()
+        return self.devices
+
+    async def get_async(self, force=False):
+        if force or self.is_stale():
+            await self.refresh_async()
+        return self.devices
+
+
+def run_blueutil_json(backend, flag, timeout=5):
+    """Run `blueutil <flag> --format json` and return the parsed list"""
+    try:
+        result = backend.run(['blueutil', flag, '--format', 'json'], timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise QueryTimeout(f"blueutil {flag} timed out")
+    return parse_blueutil_json(flag, result)
+
+
+async def run_blueutil_json_async(backend, flag, timeout=5):
+    """Coroutine version of run_blueutil_json()"""
+    try:
+        result = await backend.run_async(['blueutil', flag, '--format', 'json'], timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise QueryTimeout(f"blueutil {flag} timed out")
+    return parse_blueutil_json(flag, result)
+
+
+def parse_blueutil_json(flag, result):
+    if result.returncode != 0:
+        raise QueryFailed(f"blueutil {flag} failed: {result.stderr.strip()}")
+    if not result.stdout.strip():
+        return []
+    try:
+        return json.loads(result.stdout)
+    except json.JSONDecodeError as e:
+        raise QueryFailed(f"Failed to parse blueutil {flag} JSON output: {e}")
+
+
+class DeviceQuery:
+    """Resolves the trusted devices' state with one blueutil call per cycle"""
+
+    def __init__(self, backend, clock, paired_cache_ttl=300):
+        self.backend = backend
+        self.clock = clock
+        self.paired = PairedDeviceCache(backend, clock, paired_cache_ttl)
+        self.connected = {}
+        self.connected_names = {}
+        self.last_seen = {}
+
+    def connected_devices(self):
+        """Connected devices indexed by normalized MAC (one blueutil call)"""
+        return self._index_connected(run_blueutil_json(self.backend, '--connected'))
+
+    async def connected_devices_async(self):
+        return self._index_connected(await run_blueutil_json_async(self.backend, '--connected'))
+
+    def _index_connected(self, raw_devices):
+        connected = {}
+        for raw in raw_devices:
+            record = device_record(raw, connected=True)
+            connected[record['address']] = record
+        now = self.clock.now()
+        for address in connected:
+            self.last_seen[address] = now
+        self.connected = connected
+        self.connected_names = index_names(connected)
+        return connected
+
+    @staticmethod
+    def _match(devices, names, target):
+        """Look a target up by MAC; targets configured without one by exact name, then name substring"""
+        if target.mac:
+            # Never fall back to the name: another device's name may contain it
+            return devices.get(target.mac)
+        if target.key:
+            address = names.get(target.key)
+            if address is None:
+                address = next((address for name, address in names.items() if target.key in name), None)
+            if address is not None:
+                return devices[address]
+        return None
+
+    def _fill_paired(self, targets, found, paired):
+        """Fill in the targets that are not connected from the paired-device index"""
+        return [device or self._match(paired, self.paired.names, target)
+                for target, device in zip(targets, found)]
+
+    def find_all(self, targets):
+        """Return one device dict (or None if not paired) per target, from a single scan.
+
+        Raises QueryFailed if the connected-device query itself failed.
+        """
+        connected = self.connected_devices()
+        found = [self._match(connected, self.connected_names, target) for target in targets]
+        if all(found):
+            return found
+
+        # Not all connected: paired status comes from the cache; only re-scan
+        # the paired list when the cache has gone stale
+        try:
+            return self._fill_paired(targets, found, self.paired.get())
+        except QueryFailed as e:
+            logger.warning(f"Paired device refresh failed: {e}")
+            return self._fill_paired(targets, found, self.paired.devices)
+
+    async def find_all_async(self, targets):
+        """Coroutine version of find_all()"""
+        connected = await self.connected_devices_async()
+        found = [self._match(connected, self.connected_names, target) for target in targets]
+        if all(found):
+            return found
+
+        try:
+            return self._fill_paired(targets, found, await self.paired.get_async())
+        except QueryFailed as e:
+            logger.warning(f"Paired device refresh failed: {e}")
+            return self._fill_paired(targets, found, self.paired.devices)
+
+    def scan(self):
+        """Full device list (connected first), refreshing the paired cache"""
+        connected = self.connected_devices()
+        devices = list(connected.values())
+        try:
+            paired = self.paired.get(force=True)
+        except QueryFailed as e:
+            logger.warning(f"Paired device refresh failed: {e}")
+            paired = self.paired.devices
+        for address, device in paired.items():
+            if address not in connected:
+                devices.append(device)
+        return devices
+
+    def device_table(self):
+        """Every known device from memory: the paired cache overlaid with the last connected scan"""
+        table = {address: dict(device) for address, device in list(self.paired.devices.items())}
+        for address, device in list(self.connected.items()):
+            table[address] = dict(device)
+        for address, seen in list(self.last_seen.items()):
+            if address in table:
+                table[address]['last_seen'] = seen.isoformat()
+        return sorted(table.values(), key=lambda device: not device['connected'])
@@ -0,0 +1,192 @@
+"""
+Lock actions for Mac Proximity Lock.
+
+When the monitor decides to lock, every configured action starts at once on
+its own thread: the lock command (display sleep by default), pausing media,
+a webhook. Each has its own timeout, and the monitor loop never waits for
+them; it picks the results up on its next cycles, the way it does reconnect
+attempts. Commands are parsed when the config is loaded and resolved on
+PATH when it is applied, so a missing binary shows up at startup rather
+than at the first lock.
+"""
+
+import collections
+import json
+import shlex
+import subprocess
+import threading
+from datetime import timedelta
+
+ACTION_TYPES = ('command', 'media_pause', 'webhook')
+
+DEFAULT_ACTION_TIMEOUT = 5
+
+# Pauses Music if it is playing; other players can be paused with a command action
+MEDIA_PAUSE_COMMAND = ['osascript', '-e', 'if application "Music" is running then tell application "Music" to pause']
+
+# name: for logs and metrics; argv or url depending on kind; locks: whether
+# this action is what actually locks the screen
+LockAction = collections.namedtuple('LockAction', 'name kind argv url timeout locks')
+
+ActionResult = collections.namedtuple('ActionResult', 'name outcome seconds error')
+
+# One firing of the pipeline once every action has finished
+LockRun = collections.namedtuple('LockRun', 'decided_at seconds locked results at')
+
+
+def parse_lock_actions(config):
+    """LockActions from config['lock_actions'], plus lock_command unless they include a command.
+
+    Raises ValueError describing the first invalid entry.
+    """
+    specs = config.get('lock_actions') or []
+    if not isinstance(specs, list):
+        raise ValueError("expected a list of actions")
+    if not any(isinstance(spec, dict) and spec.get('type') == 'command' for spec in specs):
+        # Only a command locks the screen; webhooks and media_pause run alongside it
+        specs = specs + [{'type': 'command', 'command': config['lock_command']}]
+    actions = []
+    names = set()
+    for i, spec in enumerate(specs, 1):
+        if not isinstance(spec, dict) or spec.get('type') not in ACTION_TYPES:
+            raise ValueError(f"action {i}: expected an object with \"type\" one of {', '.join(ACTION_TYPES)}")
+        kind = spec['type']
+        timeout = spec.get('timeout', DEFAULT_ACTION_TIMEOUT)
+        if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0:
+            raise ValueError(f"action {i}: timeout must be a positive number, got {timeout!r}")
+
+        argv = url = None
+        if kind == 'command':
+            command = spec.get('command')
+            if not isinstance(command, str):
+                raise ValueError(f"action {i}: command must be a string")
+            try:
+                argv = shlex.split(command)
+            except ValueError as e:
+                raise ValueError(f"action {i}: {e}")
+            if not argv:
+                raise ValueError(f"action {i}: command must not be empty")
+            default_name = argv[0].rsplit('/', 1)[-1]
+        elif kind == 'media_pause':
+            argv = list(MEDIA_PAUSE_COMMAND)
+            default_name = 'media_pause'
+        else:
+            url = spec.get('url')
+            if not isinstance(url, str) or not url.startswith(('http://', 'https://')):
+                raise ValueError(f"action {i}: url must be an http:// or https:// URL")
+            default_name = 'webhook'
+
+        name = spec.get('name') or default_name
+        if not isinstance(name, str):
+            raise ValueError(f"action {i}: name must be a string")
+        if name in names:
+            name = f"{name}_{i}"
+        names.add(name)
+        actions.append(LockAction(name, kind, argv, url, timeout, kind == 'command'))
+    return actions
+
+
+def resolve_actions(actions, backend):
+    """Resolve each command on PATH. Returns (usable actions, problems)"""
+    resolved = []
+    problems = []
+    for action in actions:
+        if action.argv is not None:
+            path = backend.which(action.argv[0])
+            if path is None:
+                problems.append(f"{action.name}: command not found: {action.argv[0]}")
+                continue
+            action = action._replace(argv=[path] + action.argv[1:])
+        resolved.append(action)
+    return resolved, problems
+
+
+class LockPipeline:
+    """Runs the lock actions concurrently, each with its own timeout.
+
+    With threaded=False (simulated clocks) the actions run inline when
+    fired, each timed on a detached clock as if it ran alongside the
+    others, and their results become visible once that much time passed.
+    """
+
+    def __init__(self, backend, clock, threaded=True):
+        self.backend = backend
+        self.clock = clock
+        self.threaded = threaded
+        self.actions = []
+        self.problems = []
+        self.lock = threading.Lock()
+        self.runs = collections.deque()
+        self.pending = 0
+
+    def configure(self, actions):
+        self.actions, self.problems = resolve_actions(actions, self.backend)
+
+    def busy(self):
+        """True from fire() until the run's result has been polled"""
+        with self.lock:
+            return self.pending > 0 or bool(self.runs)
+
+    def fire(self, payload=None):
+        """Start every action. Returns False if a previous run is still going"""
+        if self.busy() or not self.actions:
+            return False
+        decided_at = self.clock.now()
+        run = {'decided_at': decided_at, 'left': len(self.actions), 'results': [],
+               'locking': set(action.name for action in self.actions if action.locks)}
+        body = json.dumps(dict(payload or {}, event='lock', at=decided_at.isoformat())).encode()
+        with self.lock:
+            self.pending += 1
+
+        for action in self.actions:
+            if self.threaded:
+                threading.Thread(target=self._run_action, args=(run, action, body),
+                                 name=f"lock-action-{action.name}", daemon=True).start()
+            else:
+                with self.clock.detached() as timer:
+                    result = self._execute(action, body, lambda: timer.elapsed)
+                self._finish(run, result)
+        return True
+
+    def poll(self):
+        """Return the runs that have completed by now"""
+        now = self.clock.now()
+        ready = []
+        with self.lock:
+            while self.runs and self.runs[0].at <= now:
+                ready.append(self.runs.popleft())
+        return ready
+
+    def _run_action(self, run, action, body):
+        started = self.clock.now()
+        self._finish(run, self._execute(action, body,
+                                        lambda: (self.clock.now() - started).total_seconds()))
+
+    def _execute(self, action, body, elapsed):
+        try:
+            if action.kind == 'webhook':
+                status = self.backend.post(action.url, body, timeout=action.timeout)
+                if not 200 <= status < 300:
+                    return ActionResult(action.name, 'error', elapsed(), f"HTTP {status}")
+            else:
+                result = self.backend.run(action.argv, timeout=action.timeout)
+                if result.returncode != 0:
+                    error = (result.stderr or '').strip() or f"exit status {result.returncode}"
+                    return ActionResult(action.name, 'error', elapsed(), error)
+        except subprocess.TimeoutExpired:
+            return ActionResult(action.name, 'timeout', elapsed(), f"timed out after {action.timeout}s")
+        except Exception as e:
+            return ActionResult(action.name, 'error', elapsed(), str(e))
+        return ActionResult(action.name, 'ok', elapsed(), None)
+
+    def _finish(self, run, result):
+        with self.lock:
+            run['results'].append(result)
+            run['left'] -= 1
+            if run['left']:
+                return
+            seconds = max(r.seconds for r in run['results'])
+            locked = any(r.outcome == 'ok' and r.name in run['locking'] for r in run['results'])
+            self.runs.append(LockRun(run['decided_at'], seconds, locked, run['results'],
+                                     run['decided_at'] + timedelta(seconds=seconds)))
+            self.pending -= 1
@@ -0,0 +1,349 @@
+"""
+Log analytics for Mac Proximity Lock.
+
+`--stats` answers "how often did it lock, how long was I away, how often
+did reconnecting work" from proximity_lock.log without loading it: the log
+is read line by line and only lines carrying an event are decoded. Every
+figure goes into a counter or a fixed-bucket histogram, so memory stays
+the same however large the log is. Where the run stopped (file, byte
+offset) and the totals so far are saved in a checkpoint next to the log,
+so the next run only reads what was written since, including the tail of
+a file that has been rotated away in the meantime.
+"""
+
+import glob
+import json
+import os
+import re
+from datetime import datetime
+
+from metrics import Histogram
+
+LOG_FILE = 'proximity_lock.log'
+CHECKPOINT_FILE = 'proximity_lock.stats.json'
+
+# Bumped when the checkpoint layout changes; an old checkpoint is then ignored
+CHECKPOINT_VERSION = 1
+
+# Bucket upper bounds: seconds away, seconds to lock, dBm
+AWAY_BUCKETS = (10, 30, 60, 120, 300, 900, 1800, 3600, 4 * 3600, 12 * 3600)
+TIME_TO_LOCK_BUCKETS = (5, 10, 15, 20, 25, 30, 45, 60, 90, 120, 300)
+RSSI_BUCKETS = (-90, -80, -75, -70, -65, -60, -55, -50, -40, -30)
+
+# An away shorter than this that still locked counts as a false lock (the
+# same threshold --replay-min-away uses by default)
+FALSE_LOCK_AWAY = 60
+
+# "2026-10-17 03:49:58,978 - INFO - message"
+TIMESTAMP_LENGTH = 23
+
+# Suffixes the rotating handlers give old logs: ".3", or ".2026-10-17" / ".2026-10-17_09" with log_rotate_when
+ROTATED_SUFFIX = re.compile(r'\.\d[\d_-]*')
+
+# Cycle lines are most of the log; only the connected ones matter (for RSSI)
+CYCLE_PREFIX = b'[Cycle '
+RSSI_MARKER = b'CONNECTED | RSSI: '
+RSSI_VALUE = re.compile(rb'-?\d+')
+
+# Other events, one named group each, matched at the start of the message
+# (after its emoji, if any) so non-matching lines are rejected quickly
+EVENTS = re.compile(
+    rb'(?:\S+ +)?(?:'
+    rb'(?P<left>Device DISCONNECTED - starting)'
+    rb'|(?P<departing>Signal trend says user is walking away)'
+    rb'|(?P<recovered>Signal recovered - cancelling early lock)'
+    rb'|(?P<returned>Device RECONNECTED - assuming|Device reconnected! User likely returned'
+    rb'|Screen was manually unlocked|Assuming user returned and unlocked|Early lock was a false alarm)'
+    rb'|(?P<lock>LOCKING SCREEN NOW!)'
+    rb'|(?P<locked>Screen locked successfully)'
+    rb'|(?P<lock_failed>Failed to lock screen)'
+    rb'|(?P<reconnect_rounds>Device away for [\d.]+s, reconnecting|Device still disconnected, requesting)'
+    rb'|(?P<reconnect_attempts>Attempting to reconnect to)'
+    rb'|(?P<reconnect_ok>Reconnection successful!)'
+    rb'|(?P<reconnect_gave_up>Reconnection attempt \d+/\d+ failed after [\d.]+s, giving up)'
+    rb'|(?P<started>Starting proximity monitoring\.\.\.)'
+    rb')'
+)
+
+
+def parse_timestamp(line):
+    """Seconds since the epoch of a log line, or None if it doesn't start with a timestamp"""
+    try:
+        return datetime.strptime(line[:TIMESTAMP_LENGTH].decode('ascii'), '%Y-%m-%d %H:%M:%S,%f').timestamp()
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class LogStats:
+    """Running totals over the log, updated one line at a time"""
+
+    COUNTERS = ('lines', 'bytes', 'starts', 'aways', 'locks', 'forced_locks', 'locks_ok', 'locks_failed',
+                'false_locks', 'reconnect_rounds', 'reconnect_attempts', 'reconnect_ok', 'reconnect_gave_up')
+
+    def __init__(self):
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.away = Histogram(AWAY_BUCKETS)
+        self.time_to_lock = Histogram(TIME_TO_LOCK_BUCKETS)
+        self.rssi = Histogram(RSSI_BUCKETS)
+        self.first = None
+        self.last = None
+        # Timestamp of the last "CONNECTED" cycle line, kept undecoded: the
+        # monitor counts an away from the last cycle that saw the device
+        self.last_connected = b''
+        # Away in progress where the last read stopped: when it began,
+        # whether it is only a predicted departure, whether it locked
+        self.away_since = None
+        self.predicted = False
+        self.locked = False
+
+    def feed(self, line):
+        """Account for one raw log line"""
+        self.counters['lines'] += 1
+        self.counters['bytes'] += len(line)
+        # The message starts after the second " - " (timestamp, level)
+        start = line.find(b' - ', TIMESTAMP_LENGTH + 3) + 3
+        if line.startswith(CYCLE_PREFIX, start):
+            marker = line.find(RSSI_MARKER, start)
+            if marker >= 0:
+                value = RSSI_VALUE.match(line, marker + len(RSSI_MARKER))
+                if value is not None:
+                    self.rssi.observe(int(value.group()))
+                self.last_connected = line[:TIMESTAMP_LENGTH]
+            return
+        match = EVENTS.match(line, start)
+        if match is None:
+            return
+        event = match.lastgroup
+
+        at = parse_timestamp(line)
+        if at is None:
+            return
+        if self.first is None:
+            self.first = at
+        self.last = at
+        counters = self.counters
+
+        if event == 'left':
+            if self.away_since is None:
+                self.away_since = parse_timestamp(self.last_connected) or at
+            self.predicted = False
+        elif event == 'departing':
+            if self.away_since is None:
+                self.away_since = at
+                self.predicted = True
+        elif event == 'recovered':
+            if self.predicted and not self.locked:
+                self.away_since = None
+                self.predicted = False
+        elif event == 'returned':
+            self.end_away(at)
+        elif event == 'lock':
+            counters['locks'] += 1
+            if b'requested over control socket' in line:
+                counters['forced_locks'] += 1
+            elif self.away_since is not None and not self.locked:
+                self.time_to_lock.observe(at - self.away_since)
+            self.locked = True
+        elif event == 'locked':
+            counters['locks_ok'] += 1
+        elif event == 'lock_failed':
+            counters['locks_failed'] += 1
+        elif event == 'started':
+            # The previous run's away (if any) ended somewhere we can't see
+            counters['starts'] += 1
+            self.last_connected = b''
+            self.away_since = None
+            self.predicted = False
+            self.locked = False
+        else:
+            counters[event] += 1
+
+    def end_away(self, at):
+        if self.away_since is not None:
+            seconds = at - self.away_since
+            self.counters['aways'] += 1
+            self.away.observe(seconds)
+            if self.locked and seconds < FALSE_LOCK_AWAY:
+                self.counters['false_locks'] += 1
+        self.away_since = None
+        self.predicted = False
+        self.locked = False
+
+    def to_dict(self):
+        return {
+            'counters': self.counters,
+            'histograms': {name: {'counts': h.counts, 'count': h.count, 'sum': h.sum}
+                           for name, h in (('away', self.away), ('time_to_lock', self.time_to_lock),
+                                           ('rssi', self.rssi))},
+            'first': self.first, 'last': self.last, 'last_connected': self.last_connected.decode('ascii', 'replace'),
+            'away_since': self.away_since, 'predicted': self.predicted, 'locked': self.locked,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.counters.update(data['counters'])
+        for name, saved in data['histograms'].items():
+            histogram = getattr(stats, name)
+            if len(saved['counts']) == len(histogram.counts):
+                histogram.counts = saved['counts']
+                histogram.count = saved['count']
+                histogram.sum = saved['sum']
+        for key in ('first', 'last', 'away_since', 'predicted', 'locked'):
+            setattr(stats, key, data[key])
+        stats.last_connected = data['last_connected'].encode('ascii', 'replace')
+        return stats
+
+
+def load_checkpoint(path):
+    """(position, LogStats) saved by the last run, or (None, fresh LogStats)"""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('version') == CHECKPOINT_VERSION:
+            return data['position'], LogStats.from_dict(data['stats'])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None, LogStats()
+
+
+def save_checkpoint(path, position, stats):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump({'version': CHECKPOINT_VERSION, 'position': position, 'stats': stats.to_dict()}, f)
+    os.replace(tmp, path)
+
+
+def pending_files(log_path, position):
+    """(path, offset) pairs still to read, oldest first.
+
+    position is {'inode', 'offset'} of where the last run stopped. If that
+    file has since been rotated (proximity_lock.log.1, or .2026-10-17 with
+    log_rotate_when), its tail and every newer rotated file are read before
+    the current log. Without a checkpoint, all rotated files are read.
+    """
+    rotated = []
+    for path in glob.glob(f"{glob.escape(log_path)}.*"):
+        if not ROTATED_SUFFIX.fullmatch(path[len(log_path):]):
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        rotated.append((stat.st_mtime, path, stat))
+    rotated.sort()
+
+    try:
+        current = os.stat(log_path)
+    except OSError:
+        current = None
+    if position is not None and current is not None and current.st_ino == position['inode'] \
+            and current.st_size >= position['offset']:
+        return [(log_path, position['offset'])]
+
+    files = [(path, 0) for _, path, _ in rotated]
+    if position is not None:
+        for i, (_, path, stat) in enumerate(rotated):
+            if stat.st_ino == position['inode'] and stat.st_size >= position['offset']:
+                files = [(path, position['offset'])] + [(path, 0) for _, path, _ in rotated[i + 1:]]
+                break
+    if current is not None:
+        files.append((log_path, 0))
+    return files
+
+
+def read_lines(path, offset, stats, partial_ok):
+    """Feed every line from offset on into stats; returns (inode, offset after the last line read).
+
+    A last line without a newline is still being written and is left for
+    the next run unless partial_ok (a rotated file, which won't grow).
+    """
+    with open(path, 'rb', buffering=1 << 20) as f:
+        inode = os.fstat(f.fileno()).st_ino
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b'\n') and not partial_ok:
+                break
+            stats.feed(line)
+            offset += len(line)
+    return inode, offset
+
+
+def collect_stats(log_path=LOG_FILE, checkpoint_path=None, reset=False):
+    """Bring the checkpointed totals up to date with the log. Returns (stats, lines read now)"""
+    if checkpoint_path is None:
+        checkpoint_path = os.path.join(os.path.dirname(log_path), CHECKPOINT_FILE)
+    position, stats = (None, LogStats()) if reset else load_checkpoint(checkpoint_path)
+    lines_before = stats.counters['lines']
+
+    for path, offset in pending_files(log_path, position):
+        inode, end = read_lines(path, offset, stats, partial_ok=path != log_path)
+        position = {'inode': inode, 'offset': end}
+    if position is not None:
+        save_checkpoint(checkpoint_path, position, stats)
+    return stats, stats.counters['lines'] - lines_before
+
+
+def format_distribution(histogram, unit, format_bound):
+    """One row per non-empty bucket with a bar scaled to the fullest one"""
+    if not histogram.count:
+        return []
+    lines = []
+    widest = max(histogram.counts)
+    bounds = [format_bound(bound) for bound in histogram.buckets] + ["more"]
+    for i, (bound, count) in enumerate(zip(bounds, histogram.counts)):
+        if not count:
+            continue
+        label = f"≤ {bound}{unit}" if i < len(histogram.buckets) else f"> {bounds[-2]}{unit}"
+        lines.append(f"    {label:<12}{count:>8,}  {'█' * max(1, round(count / widest * 30))}")
+    return lines
+
+
+def format_duration(seconds):
+    if seconds == float('inf'):
+        return "∞"
+    if seconds >= 3600:
+        return f"{seconds / 3600:g}h"
+    if seconds >= 60:
+        return f"{seconds / 60:g}m"
+    return f"{seconds:g}s"
+
+
+def format_stats(stats, log_path, read_now):
+    """Render the totals for the terminal"""
+    c = stats.counters
+    lines = ["=== Mac Proximity Lock Log Stats ==="]
+    lines.append(f"Log:            {log_path} | {c['lines']:,} lines ({c['bytes'] / 1e6:.1f} MB), "
+                 f"{read_now:,} new since the last run")
+    if stats.first is None:
+        lines.append("No monitor events found")
+        return "\n".join(lines)
+    first = datetime.fromtimestamp(stats.first).strftime('%Y-%m-%d %H:%M')
+    last = datetime.fromtimestamp(stats.last).strftime('%Y-%m-%d %H:%M')
+    lines.append(f"Period:         {first} → {last} | {c['starts']} monitor starts")
+
+    lines.append(f"Away:           {c['aways']:,} times | p50 ≤{format_duration(stats.away.quantile(0.5) or 0)} | "
+                 f"p90 ≤{format_duration(stats.away.quantile(0.9) or 0)}"
+                 + (" | away now" if stats.away_since is not None else ""))
+    lines.extend(format_distribution(stats.away, "", format_duration))
+
+    lines.append(f"Locks:          {c['locks']:,} ({c['locks_ok']:,} ok, {c['locks_failed']:,} failed) | "
+                 f"{c['forced_locks']:,} over the control socket | "
+                 f"{c['false_locks']:,} false (back within {FALSE_LOCK_AWAY}s)")
+    ttl = stats.time_to_lock
+    if ttl.count:
+        lines.append(f"Time to lock:   mean {ttl.sum / ttl.count:.1f}s | p50 ≤{ttl.quantile(0.5):g}s | "
+                     f"p90 ≤{ttl.quantile(0.9):g}s")
+        lines.extend(format_distribution(ttl, "s", lambda bound: f"{bound:g}"))
+
+    attempts = c['reconnect_attempts']
+    rate = f" ({c['reconnect_ok'] / attempts:.0%})" if attempts else ""
+    lines.append(f"Reconnects:     {attempts:,} attempts, {c['reconnect_ok']:,} ok{rate} | "
+                 f"{c['reconnect_rounds']:,} rounds, {c['reconnect_gave_up']:,} gave up")
+
+    rssi = stats.rssi
+    if rssi.count:
+        lines.append(f"RSSI:           {rssi.count:,} samples | mean {rssi.sum / rssi.count:.1f}dBm | "
+                     f"p50 ≤{rssi.quantile(0.5)}dBm")
+        lines.extend(format_distribution(rssi, "dBm", str))
+    return "\n".join(lines)
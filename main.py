@@ -5,68 +5,256 @@ Automatically locks your MacBook when your Android device moves away.
 """
 
 import subprocess
-import time
 import json
 import argparse
 import logging
-from datetime import datetime, timedelta
+import collections
+import signal
+from datetime import timedelta
 from pathlib import Path
 
+from backends import SubprocessBackend, SystemClock
+from device_query import DeviceQuery, QueryFailed, QueryTimeout, combine_presence
+from scheduler import AdaptiveScheduler
+from screen_state import ScreenLockState
+import decision
+from decision import DecisionEngine
+from reconnect import ReconnectWorker
+from control import ControlServer, socket_path_for, request as control_request
+from metrics import Metrics, MetricsServer
+from budget import CycleBudget, BudgetedBackend
+from settings import Settings, ConfigError, RESTART_KEYS, RELATED_KEYS, changed_keys
+from lock_actions import LockPipeline, resolve_actions
+
+# Cycle timings kept in memory for the control socket's "timings" command
+RECENT_CYCLES = 50
+
+DEFAULT_CONFIG = {
+    "device_name": "",
+    "device_mac": "",
+    "devices": [],
+    "presence_policy": "any",
+    "timeout_seconds": 30,
+    "scan_interval": 5,
+    "cycle_budget_seconds": 8,
+    "log_level": "INFO",
+    "lock_command": "pmset displaysleepnow",
+    "lock_actions": [],
+    "auto_reconnect": True,
+    "max_reconnect_attempts": 3,
+    "reconnect_delay": 2,
+    "reconnect_max_delay": 30,
+    "reconnect_jitter": 0.3,
+    "paired_cache_ttl": 300,
+    "async_hedge_delay": 1.0,
+    "adaptive_scan": True,
+    "min_scan_interval": 1,
+    "max_scan_interval": 15,
+    "screen_state_ttl": 3,
+    "screen_lock_notifications": True,
+    "rssi_history_size": 32,
+    "rssi_smoothing": "kalman",
+    "early_lock": False,
+    "early_lock_timeout": 5,
+    "early_lock_slope": -0.75,
+    "early_lock_rssi": -65,
+    "early_lock_window": 20,
+    "control_socket": "proximity_lock.sock",
+    "metrics_port": 0,
+    "metrics_log_interval": 300,
+    "log_mode": "cycles",
+    "log_heartbeat_interval": 300,
+    "log_max_bytes": 1048576,
+    "log_backup_count": 5,
+    "log_rotate_when": "",
+    "trace_size": 500,
+    "watch_config": True
+}
+
 class ProximityLock:
-    def __init__(self, config_path="config.json"):
+    def __init__(self, config_path="config.json", backend=None, clock=None):
         self.config_path = Path(config_path)
+        self.backend = backend or SubprocessBackend()
+        self.clock = clock or SystemClock()
+        # Handlers are only set up when monitoring starts, so --setup and
+        # --list-devices don't open the log file
+        self.logger = logging.getLogger(__name__)
+        self.config_mtime = None
         self.config = self.load_config()
-        self.setup_logging()
-        self.last_seen = datetime.now()
-        self.is_locked = False
-        self.last_connection_state = None
-        self.reconnect_attempts = 0
+        self.settings = self.startup_settings(self.config)
+        self.config = self.settings.config
+        self.metrics = Metrics(self.clock)
+        self.metrics_server = None
+        self.metrics_logged_at = self.clock.now()
+        # Lookups and screen checks run within the cycle budget; lock actions
+        # and background reconnects keep their own timeouts
+        self.budget = CycleBudget(self.clock)
+        self.probe_backend = BudgetedBackend(self.backend, self.budget)
+        self.device_query = DeviceQuery(self.probe_backend, self.clock)
+        self.reconnector = ReconnectWorker(self.attempt_reconnect, self.clock,
+                                           threaded=not self.clock.simulated)
+        self.screen_state = ScreenLockState(self.probe_backend, self.clock)
+        self.lock_pipeline = LockPipeline(self.backend, self.clock, threaded=not self.clock.simulated)
+        # DecisionEngine works in seconds since startup
+        self.epoch = self.clock.now()
+        self.engine = DecisionEngine(self.config, 0.0)
+        self.apply_config()
+        self.scan_reason = None
+        self.cycle = 0
+        self.cycle_timings = collections.deque(maxlen=RECENT_CYCLES)
+        self.paused = False
+        self.monitoring_paused = False
+        self.reload_requested = False
+        self.lock_requested = False
+        self.control = None
+        self.cycle_trace = collections.deque(maxlen=self.config['trace_size'])
+        self.trace_requested = False
+        self.heartbeat_at = None
+        self.recorder = None
         
-    def setup_logging(self):
-        """Configure logging"""
-        log_level = getattr(logging, self.config.get('log_level', 'INFO').upper())
-        logging.basicConfig(
-            level=log_level,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('proximity_lock.log'),
-                logging.StreamHandler()
-            ]
+    def apply_config(self):
+        """(Re)configure the components built from config values"""
+        self.targets = self.settings.targets
+        # Last cycle's lookup result for each target
+        self.presence = [None] * len(self.targets)
+        self.device_query.paired.ttl = self.config['paired_cache_ttl']
+        self.budget.seconds = self.config['cycle_budget_seconds']
+        self.scheduler = AdaptiveScheduler(
+            self.config['scan_interval'],
+            self.config['min_scan_interval'],
+            self.config['max_scan_interval'],
+            self.config['timeout_seconds']
         )
-        self.logger = logging.getLogger(__name__)
+        self.engine.configure(self.config)
+        self.reconnector.base_delay = self.config['reconnect_delay']
+        self.reconnector.max_attempts = self.config['max_reconnect_attempts']
+        self.reconnector.max_delay = self.config['reconnect_max_delay']
+        self.reconnector.jitter = self.config['reconnect_jitter']
+        self.screen_state.ttl = self.config['screen_state_ttl']
+        self.screen_state.use_notifications = self.config['screen_lock_notifications']
+        self.lock_pipeline.configure(self.settings.lock_actions)
+    
+    def setup_logging(self):
+        """Configure logging: records are queued and written by a background thread to a rotating file"""
+        root = logging.getLogger()
+        if root.handlers:
+            # Already configured (another instance, or the benchmark silencing output)
+            return
+        import atexit
+        import queue
+        from logging.handlers import (QueueHandler, QueueListener, RotatingFileHandler,
+                                      TimedRotatingFileHandler)
+        
+        if self.config['log_rotate_when']:
+            file_handler = TimedRotatingFileHandler(
+                'proximity_lock.log', when=self.config['log_rotate_when'],
+                backupCount=self.config['log_backup_count'], delay=True)
+        else:
+            file_handler = RotatingFileHandler(
+                'proximity_lock.log', maxBytes=self.config['log_max_bytes'],
+                backupCount=self.config['log_backup_count'], delay=True)
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        handlers = [file_handler, logging.StreamHandler()]
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        
+        # The monitor loop only enqueues; disk and terminal writes happen off-thread
+        log_queue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, *handlers)
+        root.addHandler(QueueHandler(log_queue))
+        root.setLevel(self.settings.log_level)
+        listener.start()
+        atexit.register(listener.stop)
         
     def load_config(self):
         """Load configuration from JSON file"""
-        default_config = {
-            "device_name": "",
-            "device_mac": "",
-            "timeout_seconds": 30,
-            "scan_interval": 5,
-            "log_level": "INFO",
-            "lock_command": "pmset displaysleepnow",
-            "auto_reconnect": True,
-            "max_reconnect_attempts": 3,
-            "reconnect_delay": 2
-        }
         
         if not self.config_path.exists():
             with open(self.config_path, 'w') as f:
-                json.dump(default_config, f, indent=2)
+                json.dump(DEFAULT_CONFIG, f, indent=2)
             print(f"Created config file: {self.config_path}")
             print("Please edit the config file with your device information.")
-            return default_config
+            self.config_mtime = self.config_stamp()
+            return dict(DEFAULT_CONFIG)
             
+        self.config_mtime = self.config_stamp()
         try:
-            with open(self.config_path, 'r') as f:
-                config = json.load(f)
-                # Merge with defaults for any missing keys
-                for key, value in default_config.items():
-                    if key not in config:
-                        config[key] = value
-                return config
+            return self.read_config()
         except Exception as e:
             print(f"Error loading config: {e}")
-            return default_config
+            return dict(DEFAULT_CONFIG)
+    
+    def read_config(self):
+        """Parse the config file, with defaults for any missing keys"""
+        with open(self.config_path, 'r') as f:
+            config = json.load(f)
+        if not isinstance(config, dict):
+            raise ValueError("expected a JSON object")
+        return dict(DEFAULT_CONFIG, **config)
+    
+    def config_stamp(self):
+        """Modification time of the config file (None if it is missing)"""
+        try:
+            return self.config_path.stat().st_mtime_ns
+        except OSError:
+            return None
+    
+    def startup_settings(self, config):
+        """Settings for the initial config; invalid values are reported and replaced by their defaults"""
+        while True:
+            try:
+                return Settings(config)
+            except ConfigError as e:
+                errors = e.errors
+            # Resetting one key can expose an error in another (lock_actions is
+            # only checked once lock_command is valid), hence the loop
+            keys = dict.fromkeys(key for error_key in errors for key in (error_key,) + RELATED_KEYS.get(error_key, ()))
+            if all(config.get(key) == DEFAULT_CONFIG[key] for key in keys):
+                print(f"Invalid config ({'; '.join(f'{key}: {message}' for key, message in errors.items())}) - using the default config")
+                return Settings(dict(DEFAULT_CONFIG))
+            for key in keys:
+                reason = errors.get(key, "invalid together with " + ", ".join(k for k in errors if key in RELATED_KEYS.get(k, ())))
+                print(f"Invalid config value for {key}: {reason} - using {DEFAULT_CONFIG[key]!r}")
+                config[key] = DEFAULT_CONFIG[key]
+    
+    def config_changed(self):
+        """True when watch_config is on and the config file was modified since it was loaded"""
+        return self.config['watch_config'] and self.config_stamp() != self.config_mtime
+    
+    def reload_config(self):
+        """Re-read and validate the config file, then switch to it in one step.
+        
+        A file that no longer parses or has invalid values leaves the current settings in place.
+        """
+        self.config_mtime = self.config_stamp()
+        try:
+            config = self.read_config()
+            settings = Settings(config)
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Config reload failed, keeping current settings: {e}")
+            return False
+        
+        if not resolve_actions(settings.lock_actions, self.backend)[0]:
+            self.logger.error("Config reload failed, keeping current settings: none of the lock actions can run")
+            return False
+        
+        changed = changed_keys(self.config, config)
+        if not changed:
+            self.logger.debug(f"Config file {self.config_path} touched, nothing changed")
+            return True
+        self.config = config
+        self.settings = settings
+        logging.getLogger().setLevel(settings.log_level)
+        self.apply_config()
+        self.scan_reason = None
+        self.logger.info(f"🔁 Config reloaded from {self.config_path} (changed: {', '.join(changed)})")
+        self.logger.info(f"Trusted devices: {self.targets_label()} | Timeout: {self.config['timeout_seconds']} seconds")
+        for problem in self.lock_pipeline.problems:
+            self.logger.warning(f"⚠️  Lock action skipped: {problem}")
+        restart = [key for key in changed if key in RESTART_KEYS]
+        if restart:
+            self.logger.warning(f"Restart the monitor to apply: {', '.join(restart)}")
+        return True
     
     def save_config(self):
         """Save current configuration"""
@@ -74,185 +262,156 @@ class ProximityLock:
             json.dump(self.config, f, indent=2)
     
     def scan_bluetooth_devices(self):
-        """Scan for Bluetooth devices using blueutil"""
+        """Scan for Bluetooth devices using blueutil (refreshes the paired-device cache)"""
         devices = []
         
-        try:
-            # Get connected devices
-            result = subprocess.run([
-                'blueutil', '--connected', '--format', 'json'
-            ], capture_output=True, text=True, timeout=5)
-            
-            if result.returncode == 0 and result.stdout.strip():
-                connected_devices = json.loads(result.stdout)
-                for device in connected_devices:
-                    devices.append({
-                        'name': device.get('name', 'Unknown'),
-                        'address': device.get('address', '').replace('-', ':'),
-                        'connected': True,
-                        'rssi': device.get('RSSI', 'N/A'),
-                        'type': 'Mobile Phone' if 'phone' in device.get('name', '').lower() else 'Unknown'
-                    })
-            
-            # Get paired but not connected devices
-            result = subprocess.run([
-                'blueutil', '--paired', '--format', 'json'
-            ], capture_output=True, text=True, timeout=5)
-            
-            if result.returncode == 0 and result.stdout.strip():
-                paired_devices = json.loads(result.stdout)
-                connected_addresses = [d['address'].lower() for d in devices]
-                
-                for device in paired_devices:
-                    device_addr = device.get('address', '').replace('-', ':').lower()
-                    if device_addr not in connected_addresses:
-                        devices.append({
-                            'name': device.get('name', 'Unknown'),
-                            'address': device_addr,
-                            'connected': False,
-                            'rssi': 'N/A',
-                            'type': 'Mobile Phone' if 'phone' in device.get('name', '').lower() else 'Unknown'
-                        })
-                        
-        except subprocess.TimeoutExpired:
-            self.logger.warning("Bluetooth scan timed out")
-        except json.JSONDecodeError as e:
-            self.logger.error(f"Failed to parse blueutil JSON output: {e}")
-        except Exception as e:
-            self.logger.error(f"Error scanning Bluetooth devices: {e}")
+        with self.metrics.probe('scan_bluetooth_devices') as probe:
+            try:
+                devices = self.device_query.scan()
+            except QueryFailed as e:
+                probe.outcome = 'timeout' if isinstance(e, QueryTimeout) else 'error'
+                self.logger.warning(f"Bluetooth scan failed: {e}")
+            except Exception as e:
+                probe.fail(e)
+                self.logger.error(f"Error scanning Bluetooth devices: {e}")
             
         return devices
     
     def get_device_info_direct(self, device_id):
         """Get device info directly using blueutil for faster response"""
-        try:
-            result = subprocess.run([
-                'blueutil', '--info', device_id, '--format', 'json'
-            ], capture_output=True, text=True, timeout=3)
-            
-            if result.returncode == 0 and result.stdout.strip():
-                device_info = json.loads(result.stdout)
-                return {
-                    'name': device_info.get('name', 'Unknown'),
-                    'address': device_info.get('address', '').replace('-', ':'),
-                    'connected': device_info.get('connected', False),
-                    'rssi': device_info.get('RSSI', 'N/A'),
-                    'type': 'Mobile Phone' if 'phone' in device_info.get('name', '').lower() else 'Unknown',
-                    'paired': device_info.get('paired', False)
-                }
-        except Exception as e:
-            self.logger.debug(f"Failed to get direct device info: {e}")
+        with self.metrics.probe('get_device_info_direct') as probe:
+            try:
+                result = self.probe_backend.run([
+                    'blueutil', '--info', device_id, '--format', 'json'
+                ], timeout=3)
+                
+                return self.parse_device_info(result)
+            except Exception as e:
+                probe.fail(e)
+                self.logger.debug(f"Failed to get direct device info: {e}")
             
         return None
+    
+    def parse_device_info(self, result):
+        """Turn a `blueutil --info` result into a device dict (None if it failed)"""
+        if result.returncode == 0 and result.stdout.strip():
+            device_info = json.loads(result.stdout)
+            return {
+                'name': device_info.get('name', 'Unknown'),
+                'address': device_info.get('address', '').replace('-', ':'),
+                'connected': device_info.get('connected', False),
+                'rssi': device_info.get('RSSI', 'N/A'),
+                'type': 'Mobile Phone' if 'phone' in device_info.get('name', '').lower() else 'Unknown',
+                'paired': device_info.get('paired', False)
+            }
+        return None
 
+    def targets_label(self):
+        """Trusted devices for log lines, e.g. Pixel (aa:bb:...) + Watch"""
+        joiner = " + " if self.config['presence_policy'] == 'all' else " | "
+        return joiner.join(f"{target.name} ({target.mac})" if target.name and target.mac
+                           else target.name or target.mac for target in self.targets)
+    
     def is_device_nearby(self):
-        """Check if the target device is nearby and return device info"""
-        # Try direct lookup first (faster)
-        if self.config['device_mac']:
-            # Format MAC address for blueutil (it accepts various formats)
-            mac_for_blueutil = self.config['device_mac'].replace(':', '-')
-            device_info = self.get_device_info_direct(mac_for_blueutil)
+        """Look up every trusted device and return the one the presence policy decides on"""
+        self.presence = self.find_targets()
+        return combine_presence(self.presence, self.config['presence_policy'])
+    
+    def find_targets(self):
+        """Device info (or None) for each trusted device"""
+        # One batched --connected query plus the cached paired list
+        with self.metrics.probe('find_device') as probe:
+            try:
+                return self.device_query.find_all(self.targets)
+            except QueryFailed as e:
+                probe.outcome = 'timeout' if isinstance(e, QueryTimeout) else 'error'
+                self.logger.debug(f"Batched device query failed: {e}")
+            except Exception as e:
+                probe.fail(e)
+                self.logger.error(f"Error querying Bluetooth devices: {e}")
+        
+        # Fallback to direct lookups if the batched query fails
+        return [self.find_target_direct(target) for target in self.targets]
+    
+    def find_target_direct(self, target):
+        if target.mac:
+            device_info = self.get_device_info_direct(target.blueutil_mac)
             if device_info:
                 return device_info
         
-        if self.config['device_name']:
-            device_info = self.get_device_info_direct(self.config['device_name'])
+        if target.name:
+            device_info = self.get_device_info_direct(target.name)
             if device_info:
                 return device_info
                 
-        # Fallback to full scan if direct lookup fails
-        devices = self.scan_bluetooth_devices()
-        for device in devices:
-            # Check by MAC address (preferred) or name
-            if (self.config['device_mac'] and 
-                device['address'].lower() == self.config['device_mac'].lower()):
-                return device
-            elif (self.config['device_name'] and 
-                  self.config['device_name'].lower() in device['name'].lower()):
-                return device
-                
         return None
     
     def is_screen_locked(self):
-        """Check if the screen is currently locked using native macOS APIs"""
-        try:
-            # Method 1: Try PyObjC with Quartz/CoreGraphics
-            try:
-                import Quartz
-                session_dict = Quartz.CGSessionCopyCurrentDictionary()
-                if session_dict:
-                    # Check for screen lock indicators
-                    is_locked = session_dict.get('CGSSessionScreenIsLocked', False)
-                    return bool(is_locked)
-            except ImportError:
-                self.logger.debug("PyObjC/Quartz not available, trying alternative methods")
-            
-            # Method 2: Use ioreg to check screen state
-            result = subprocess.run([
-                'ioreg', '-n', 'IOHIDSystem', '-d1'
-            ], capture_output=True, text=True, timeout=3)
-            
-            if result.returncode == 0:
-                # Look for HIDIdleTime - if present and accessible, screen likely unlocked
-                if 'HIDIdleTime' in result.stdout:
-                    return False
-                    
-            # Method 3: Check if screensaver is running
-            result = subprocess.run([
-                'pgrep', 'ScreenSaverEngine'
-            ], capture_output=True, text=True, timeout=2)
-            
-            if result.returncode == 0:
-                return True  # Screensaver is running
-                
-            # Method 4: Try to access window server (requires screen access)
-            result = subprocess.run([
-                'osascript', '-e', 'tell application "System Events" to get name of first desktop'
-            ], capture_output=True, text=True, timeout=2)
-            
-            # If osascript succeeds, screen is probably not locked
-            return result.returncode != 0
-                
-        except Exception as e:
-            self.logger.debug(f"All screen lock detection methods failed: {e}")
-            # Fallback to internal state
-            return self.is_locked
+        """Check if the screen is currently locked (method resolved once, result cached briefly)"""
+        # Fallback to internal state if every detection method fails
+        with self.metrics.probe('is_screen_locked') as probe:
+            failures = self.screen_state.failures
+            locked = self.screen_state.is_locked(fallback=self.engine.locked)
+            if self.screen_state.failures != failures:
+                probe.fail()
+        return locked
 
     def attempt_reconnect(self, device_address):
         """Try to reconnect to the device using blueutil"""
-        try:
-            self.logger.info(f"🔄 Attempting to reconnect to {device_address}...")
-            
-            # Format address for blueutil
-            formatted_address = device_address.replace(':', '-')
-            
-            result = subprocess.run([
-                'blueutil', '--connect', formatted_address
-            ], capture_output=True, text=True, timeout=10)
-            
-            if result.returncode == 0:
-                self.logger.info("✅ Reconnection successful!")
-                self.reconnect_attempts = 0
-                return True
-            else:
-                self.logger.warning(f"❌ Reconnection failed: {result.stderr}")
-                return False
+        with self.metrics.probe('attempt_reconnect') as probe:
+            try:
+                self.logger.info(f"🔄 Attempting to reconnect to {device_address}...")
                 
-        except subprocess.TimeoutExpired:
-            self.logger.warning("⏰ Reconnection attempt timed out")
-            return False
-        except Exception as e:
-            self.logger.error(f"❌ Reconnection error: {e}")
-            return False
+                # Format address for blueutil
+                formatted_address = device_address.replace(':', '-')
+                
+                result = self.backend.run([
+                    'blueutil', '--connect', formatted_address
+                ], timeout=10)
+                
+                if result.returncode == 0:
+                    self.logger.info("✅ Reconnection successful!")
+                    return True
+                else:
+                    probe.fail()
+                    self.logger.warning(f"❌ Reconnection failed: {result.stderr}")
+                    return False
+                    
+            except subprocess.TimeoutExpired as e:
+                probe.fail(e)
+                self.logger.warning("⏰ Reconnection attempt timed out")
+                return False
+            except Exception as e:
+                probe.fail(e)
+                self.logger.error(f"❌ Reconnection error: {e}")
+                return False
 
-    def lock_screen(self):
-        """Lock the MacBook screen"""
-        try:
-            subprocess.run(self.config['lock_command'].split(), check=True)
-            self.logger.info("Screen locked successfully")
-            self.is_locked = True
-        except subprocess.CalledProcessError as e:
-            self.logger.error(f"Failed to lock screen: {e}")
+    def lock_screen(self, reason='timeout'):
+        """Start the lock actions; handle_lock_results() picks up how they went"""
+        payload = {'reason': reason, 'devices': [target.name or target.mac for target in self.targets],
+                   'away_seconds': round(self.engine.away_seconds(self.clock_seconds()), 1)}
+        if not self.lock_pipeline.fire(payload):
+            self.logger.debug("Lock actions from the previous lock are still running")
+            return
+        self.engine.locked = True
+        self.handle_lock_results()
+    
+    def handle_lock_results(self):
+        """Record and log finished lock actions; a failed lock is retried on the next cycle"""
+        for run in self.lock_pipeline.poll():
+            for result in run.results:
+                self.metrics.observe(f"lock_action:{result.name}", result.seconds, result.outcome)
+            self.metrics.observe('lock_screen', run.seconds, 'ok' if run.locked else 'error')
+            timings = ", ".join(f"{result.name} {result.seconds:.2f}s" for result in run.results)
+            for result in run.results:
+                if result.outcome != 'ok':
+                    self.logger.warning(f"⚠️  Lock action {result.name} failed: {result.error}")
+            if run.locked:
+                self.logger.info(f"Screen locked successfully ({timings})")
+                self.screen_state.remember(True)
+            else:
+                self.logger.error(f"Failed to lock screen ({timings})")
+                self.engine.locked = False
     
     def run_setup(self):
         """Interactive setup for device configuration"""
@@ -290,165 +449,553 @@ class ProximityLock:
         except (ValueError, KeyboardInterrupt):
             print("\nSetup cancelled")
     
-    def monitor(self):
-        """Main monitoring loop"""
-        if not self.config['device_name'] and not self.config['device_mac']:
+    def start_monitoring(self):
+        """Check the configuration and log the monitoring banner"""
+        if not self.targets:
             print("No device configured. Run with --setup first.")
-            return
+            return False
         
+        self.setup_logging()
         self.logger.info("Starting proximity monitoring...")
-        self.logger.info(f"Target device: {self.config['device_name']} ({self.config['device_mac']})")
+        if len(self.targets) > 1:
+            self.logger.info(f"Trusted devices ({self.config['presence_policy']} of): {self.targets_label()}")
+        else:
+            self.logger.info(f"Target device: {self.targets_label()}")
         self.logger.info(f"Timeout: {self.config['timeout_seconds']} seconds")
-        self.logger.info(f"Scan interval: {self.config['scan_interval']} seconds")
+        if self.budget.seconds:
+            self.logger.info(f"Cycle budget: {self.budget.seconds} seconds (probes are cut short or skipped past it)")
+        if self.config['early_lock']:
+            self.logger.info(f"Early lock: {self.config['early_lock_timeout']} seconds once RSSI trend shows departure")
+        if self.config['adaptive_scan']:
+            self.logger.info(f"Scan interval: adaptive {self.scheduler.min_interval}-{self.scheduler.max_interval} seconds (base {self.scheduler.base_interval})")
+        else:
+            self.logger.info(f"Scan interval: {self.config['scan_interval']} seconds")
+        for problem in self.lock_pipeline.problems:
+            self.logger.warning(f"⚠️  Lock action skipped: {problem}")
+        if not self.lock_pipeline.actions:
+            self.logger.error("None of the lock actions can run; not starting")
+            return False
+        self.logger.info(f"Lock actions: {', '.join(action.name for action in self.lock_pipeline.actions)}")
+        self.screen_state.resolve()
+        self.start_control_server()
+        self.start_metrics_server()
+        if self.config['log_mode'] == 'transitions':
+            self.logger.info(f"Logging: state changes only, heartbeat every {self.config['log_heartbeat_interval']} seconds")
+        if self.config['watch_config']:
+            self.logger.info(f"Watching {self.config_path} for changes")
+        if self.recorder is not None:
+            self.logger.info(f"📼 Recording probe trace to {self.recorder.path}")
+        if not self.clock.simulated and hasattr(signal, 'SIGUSR1'):
+            try:
+                signal.signal(signal.SIGUSR1, self.request_trace_dump)
+            except ValueError:
+                pass  # Not running in the main thread
         self.logger.info("=" * 60)
+        return True
+    
+    def start_control_server(self):
+        """Serve status and commands on the control socket (not for simulated runs)"""
+        if not self.config['control_socket'] or self.clock.simulated:
+            return
+        server = ControlServer(self, socket_path_for(self.config_path, self.config))
+        if server.start():
+            self.control = server
+    
+    def start_metrics_server(self):
+        """Serve Prometheus metrics on localhost when metrics_port is set"""
+        if not self.config['metrics_port'] or self.clock.simulated:
+            return
+        server = MetricsServer(self.render_metrics, self.config['metrics_port'])
+        if server.start():
+            self.metrics_server = server
+    
+    def stop_servers(self):
+        if self.control is not None:
+            self.control.stop()
+            self.control = None
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+    
+    def stop_recording(self):
+        """Close the --record trace file"""
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+    
+    def countdown(self):
+        """Away time and seconds left before the lock, from the last cycle's state"""
+        engine = self.engine
+        running = not engine.last_connected or engine.departure_predicted_at is not None
+        timeout = engine.current_timeout()
+        away = engine.away_seconds(self.clock_seconds()) if running else 0.0
+        return {
+            'away_seconds': round(away, 1),
+            'timeout_seconds': timeout,
+            'lock_in': round(max(0.0, timeout - away), 1) if running and not engine.locked else None,
+        }
+    
+    def status_snapshot(self):
+        """Monitor state for the control socket, answered from memory without probing"""
+        status = {
+            'device_name': self.config['device_name'],
+            'device_mac': self.config['device_mac'],
+            'presence_policy': self.config['presence_policy'],
+            'trusted_devices': [
+                {'name': device['name'], 'address': device['address'], 'connected': device['connected']}
+                if device else {'name': target.name, 'address': target.mac, 'connected': False}
+                for target, device in zip(self.targets, self.presence)
+            ],
+            'connected': bool(self.engine.last_connected),
+            'screen_locked': self.engine.locked,
+            'paused': self.paused,
+            'cycle': self.cycle,
+            'last_seen': (self.epoch + timedelta(seconds=self.engine.last_seen)).isoformat(),
+            'scan_reason': self.scan_reason,
+            'departure_predicted': self.engine.departure_predicted_at is not None,
+            'reconnecting': self.reconnector.active(),
+            'reconnect_attempts': self.engine.reconnect_attempts,
+        }
+        status.update(self.countdown())
+        return status
+    
+    def device_table(self):
+        return self.device_query.device_table()
+    
+    def force_lock(self):
+        """Lock on request from the control socket; the monitor loop does it at the start of its next cycle"""
+        self.lock_requested = True
+        return {'lock': 'scheduled'}
+    
+    def set_paused(self, paused):
+        """Pause or resume monitoring; the monitor loop applies it at the start of its next cycle"""
+        self.paused = paused
+        return {'paused': paused}
+    
+    def request_reload(self):
+        self.reload_requested = True
+        return {'reload': 'scheduled'}
+    
+    def handle_control_requests(self):
+        """Apply pause/resume/reload/lock requests. Returns True while monitoring is paused"""
+        if self.reload_requested or self.config_changed():
+            self.reload_requested = False
+            self.reload_config()
+        if self.lock_requested:
+            self.lock_requested = False
+            self.logger.critical("🔒 LOCKING SCREEN NOW! (requested over control socket)")
+            self.lock_screen(reason='control')
+        if self.trace_requested:
+            self.trace_requested = False
+            self.dump_trace()
+        
+        if self.paused != self.monitoring_paused:
+            self.monitoring_paused = self.paused
+            if self.paused:
+                self.logger.info("⏸️  Monitoring paused")
+                self.reconnector.cancel()
+                self.engine.reconnect_attempts = 0
+            else:
+                # Start from scratch so time spent paused doesn't count as away
+                self.logger.info("▶️  Monitoring resumed")
+                self.engine.reset(self.clock_seconds())
+        return self.paused
+    
+    def log_cycle(self, level, message):
+        """Per-cycle status line: always kept in the cycle trace, logged only in "cycles" log mode"""
+        # Formatted only when the trace is dumped
+        self.cycle_trace.append((self.clock.now(), level, message))
+        if self.config['log_mode'] != 'transitions':
+            self.logger.log(level, message)
+    
+    def log_heartbeat(self, now):
+        """In "transitions" log mode, a periodic line showing the monitor is alive"""
+        if self.config['log_mode'] != 'transitions':
+            return
+        interval = self.config['log_heartbeat_interval']
+        if self.heartbeat_at is not None and (not interval or (now - self.heartbeat_at).total_seconds() < interval):
+            return
+        self.heartbeat_at = now
+        status = self.status_snapshot()
+        connection = "connected" if status['connected'] else f"away {status['away_seconds']:.0f}s"
+        screen = "🔒 locked" if status['screen_locked'] else "🔓 unlocked"
+        self.logger.info(f"💓 Cycle {self.cycle:03d} | {self.targets_label()} {connection} | Screen: {screen} | Scan: {self.scan_reason}")
+    
+    def trace_lines(self):
+        return [f"{at.isoformat(sep=' ', timespec='milliseconds')} - {logging.getLevelName(level)} - {message}"
+                for at, level, message in list(self.cycle_trace)]
+    
+    def request_trace_dump(self, signum=None, frame=None):
+        """SIGUSR1 handler; the monitor loop writes the trace to the log before its next cycle"""
+        self.trace_requested = True
+    
+    def dump_trace(self):
+        lines = self.trace_lines()
+        self.logger.info(f"🧾 Cycle trace ({len(lines)} entries):")
+        for line in lines:
+            self.logger.info(f"    {line}")
+    
+    def record_cycle(self, started, looked_up, device_info):
+        """Record the cycle's phase timings, budget use and overruns for the control socket and metrics"""
+        now = self.clock.now()
+        duration = (now - started).total_seconds()
+        budget = self.budget.seconds
+        overrun = bool(budget) and duration > budget
+        self.metrics.observe('cycle_lookup', (looked_up - started).total_seconds())
+        self.metrics.observe('cycle_decide', (now - looked_up).total_seconds())
+        self.metrics.observe('cycle', duration)
+        self.metrics.count('probes_skipped', self.budget.skipped)
+        self.metrics.count('probes_cut_short', self.budget.cut_short)
+        self.budget.finish()
+        if overrun:
+            self.metrics.count('cycle_budget_overruns')
+            self.logger.warning(f"⏱️  Cycle {self.cycle:03d} took {duration:.1f}s, over its {budget}s budget")
+        self.cycle_timings.append({
+            'cycle': self.cycle,
+            'started': started.isoformat(),
+            'duration': round(duration, 4),
+            'overrun': overrun,
+            'probes_skipped': self.budget.skipped,
+            'connected': bool(device_info and device_info['connected']),
+            'rssi': device_info.get('rssi', 'N/A') if device_info else 'N/A',
+        })
+        if self.recorder is not None:
+            self.recorder.append(started.timestamp(), device_info, self.screen_state.last_known())
+        
+        interval = self.config['metrics_log_interval']
+        if interval and (now - self.metrics_logged_at).total_seconds() >= interval:
+            self.metrics_logged_at = now
+            self.logger.info(f"📊 Metrics: {self.metrics.summary()}")
+        self.log_heartbeat(now)
+    
+    def metrics_gauges(self):
+        countdown = self.countdown()
+        return {
+            'connected': bool(self.engine.last_connected),
+            'screen_locked': self.engine.locked,
+            'paused': self.paused,
+            'away_seconds': countdown['away_seconds'],
+            'cycles': self.cycle,
+        }
+    
+    def render_metrics(self):
+        return self.metrics.render(self.metrics_gauges())
+    
+    def handle_reconnect_events(self):
+        """Log results from the background reconnect worker. Returns (reconnected, last failed attempt)"""
+        reconnected = False
+        failed_attempt = 0
+        for event in self.reconnector.poll():
+            if event.success:
+                reconnected = True
+            else:
+                failed_attempt = event.attempt
+                if event.retry_in is not None:
+                    self.logger.info(f"🔁 Reconnection attempt {event.attempt}/{self.config['max_reconnect_attempts']} failed after {event.duration:.1f}s, retrying in {event.retry_in:.1f}s")
+                else:
+                    self.logger.warning(f"❌ Reconnection attempt {event.attempt}/{self.config['max_reconnect_attempts']} failed after {event.duration:.1f}s, giving up")
+        
+        if reconnected:
+            self.logger.info("✅ Device reconnected! User likely returned.")
+        return reconnected, failed_attempt
+    
+    def clock_seconds(self):
+        return (self.clock.now() - self.epoch).total_seconds()
+    
+    def log_transitions(self, actions):
+        """Log the state changes DecisionEngine.step() reported"""
+        engine = self.engine
+        if actions & decision.DEVICE_RETURNED:
+            # Device just reconnected - user probably returned and unlocked
+            self.logger.info("🔄 Device RECONNECTED - assuming user returned and unlocked screen")
+        if actions & decision.DEVICE_LEFT:
+            self.logger.warning("📡 Device DISCONNECTED - starting timeout countdown")
+        if actions & decision.DEPARTURE_PREDICTED:
+            slope = engine.history.slope(engine.predictor.window_seconds)
+            self.logger.warning(f"🚶 Signal trend says user is walking away (RSSI {engine.history.latest():.0f}dBm, {slope:+.1f}dB/s) - starting {self.config['early_lock_timeout']}s countdown")
+        if actions & decision.DEPARTURE_CANCELLED:
+            self.logger.info("📶 Signal recovered - cancelling early lock countdown")
+        if actions & decision.UNLOCK_ASSUMED:
+            self.logger.info("🔄 Assuming user returned and unlocked screen")
+        if actions & decision.MANUAL_UNLOCK:
+            self.logger.info("🔓 Screen was manually unlocked - user is back!")
+        if actions & decision.FALSE_ALARM:
+            self.logger.info("📶 Early lock was a false alarm - resetting RSSI trend")
+        if actions & decision.RECONNECT_NOW:
+            self.logger.info("📱 Device still disconnected, requesting immediate reconnection...")
+        if actions & decision.RECONNECT:
+            self.logger.info(f"🔄 Device away for {engine.elapsed:.1f}s, reconnecting in background (up to {self.config['max_reconnect_attempts']} attempts)...")
+    
+    def run_cycle(self, cycle, device_info):
+        """Act on one cycle's device lookup. Returns True to start the next cycle without sleeping"""
+        engine = self.engine
+        found = device_info is not None
+        connected = bool(found and device_info['connected'])
+        rssi = device_info.get('rssi', 'N/A') if found else 'N/A'
+        reconnected, failed_attempt = self.handle_reconnect_events()
+        self.handle_lock_results()
+        
+        # Only probe the screen when the decision depends on it, and not while
+        # the lock actions are still running (the screen may not be locked yet)
+        screen_locked = None
+        if engine.needs_screen_state(connected) and not self.lock_pipeline.busy():
+            screen_locked = self.is_screen_locked()
+        now = self.clock_seconds()
+        address = device_info.get('address', '') if found else ''
+        # Every trusted device keeps its own RSSI trend; step() feeds the deciding one
+        for device in self.presence:
+            if device and device is not device_info:
+                if device['connected']:
+                    engine.sample(now, device['address'], device['rssi'])
+                else:
+                    engine.forget(device['address'])
+        actions = engine.step(now, found, connected,
+                              found and device_info.get('paired', False), rssi, screen_locked,
+                              reconnected, failed_attempt, self.reconnector.active(), address)
+        if actions & decision.RESCAN:
+            return True
+        
+        self.log_transitions(actions)
+        if actions & decision.RECONNECT_NOW:
+            self.reconnector.request(address, immediate=True)
+        if actions & decision.RECONNECT:
+            self.reconnector.request(address)
+        if actions & decision.CANCEL_RECONNECT:
+            if actions & decision.TIMEOUT:
+                self.logger.info("🔄 Resetting reconnection attempts after timeout")
+            self.reconnector.cancel()
+        
+        if connected and not engine.departing:
+            # RSSI quality indicator (but don't rely on it for proximity)
+            device_name = device_info.get('name', 'Unknown')
+            if isinstance(rssi, int):
+                if rssi > -40:
+                    signal_quality = "📶 Excellent"
+                elif rssi > -60:
+                    signal_quality = "📶 Good"
+                elif rssi > -80:
+                    signal_quality = "📶 Fair"
+                else:
+                    signal_quality = "📶 Weak"
+            else:
+                signal_quality = "📶 Unknown"
+            
+            screen_status = "🔒 Screen locked" if engine.locked else "🔓 Screen unlocked"
+            self.log_cycle(logging.INFO, f"[Cycle {cycle:03d}] ✅ {device_name} CONNECTED | RSSI: {rssi}dBm | {signal_quality} | {screen_status}")
+            return False
+        
+        if actions & decision.FALSE_ALARM:
+            return False
+        
+        # Status based on how long device has been away
+        if engine.departing:
+            status = f"🚶 {device_info.get('name', 'Device')} walking away | RSSI: {rssi}dBm"
+        elif found and device_info.get('paired', False):
+            status = f"📱 {device_info.get('name', 'Device')} PAIRED but disconnected"
+            if engine.reconnect_attempts > 0:
+                status += f" (reconnect attempts: {engine.reconnect_attempts}/{self.config['max_reconnect_attempts']})"
+        elif found:
+            status = f"🔍 {device_info.get('name', 'Device')} found but not connected"
+        else:
+            status = f"❌ Device NOT FOUND"
+        
+        if not actions & decision.TIMEOUT:
+            remaining_time = max(0, engine.timeout - engine.elapsed)
+            screen_status = "🔒 locked" if engine.locked else "🔓 unlocked"
+            self.log_cycle(logging.INFO, f"[Cycle {cycle:03d}] {status} | Away: {engine.elapsed:.1f}s | Lock in: {remaining_time:.1f}s | Screen: {screen_status}")
+            return False
+        
+        self.log_cycle(logging.WARNING, f"[Cycle {cycle:03d}] {status} | Away: {engine.elapsed:.1f}s | ⚠️  TIMEOUT REACHED!")
+        if actions & decision.LOCK:
+            self.logger.critical("🔒 LOCKING SCREEN NOW!")
+            self.lock_screen()
+        else:
+            screen_status = "🔒 locked" if screen_locked is not False else "🔓 unlocked (manually)"
+            self.log_cycle(logging.INFO, f"🔒 Screen status: {screen_status} | Device still away")
+        return False
+    
+    def next_scan_interval(self, device_info):
+        """Seconds to sleep before the next cycle"""
+        if not self.config['adaptive_scan']:
+            return self.config['scan_interval']
+        
+        engine = self.engine
+        connected = bool(device_info and device_info['connected']) and engine.departure_predicted_at is None
+        rssi = device_info.get('rssi') if device_info else None
+        time_elapsed = engine.away_seconds(self.clock_seconds())
+        interval, reason = self.scheduler.next_interval(connected, rssi, time_elapsed, engine.locked,
+                                                        timeout=engine.current_timeout())
+        
+        if reason != self.scan_reason:
+            self.log_cycle(logging.INFO, f"⏱️  Scan interval {interval:.1f}s ({reason})")
+            self.scan_reason = reason
+        else:
+            self.logger.debug(f"⏱️  Next scan in {interval:.1f}s ({reason})")
+        return interval
+    
+    def monitor(self):
+        """Main monitoring loop"""
+        if not self.start_monitoring():
+            return
         
         try:
-            cycle = 0
             while True:
-                cycle += 1
-                device_info = self.is_device_nearby()
-                current_connected = device_info and device_info['connected']
-                
-                # Detect connection state changes
-                if self.last_connection_state is not None:
-                    if not self.last_connection_state and current_connected:
-                        # Device just reconnected - user probably returned and unlocked
-                        self.logger.info("🔄 Device RECONNECTED - assuming user returned and unlocked screen")
-                        self.is_locked = False
-                    elif self.last_connection_state and not current_connected:
-                        # Device just disconnected
-                        self.logger.warning("📡 Device DISCONNECTED - starting timeout countdown")
-                
-                self.last_connection_state = current_connected
+                if self.handle_control_requests():
+                    self.clock.sleep(self.config['scan_interval'])
+                    continue
                 
-                if current_connected:
-                    self.last_seen = datetime.now()
-                    
-                    # Extract signal strength info
-                    rssi = device_info.get('rssi', 'N/A')
-                    device_name = device_info.get('name', 'Unknown')
-                    
-                    # RSSI quality indicator (but don't rely on it for proximity)
-                    if isinstance(rssi, int):
-                        if rssi > -40:
-                            signal_quality = "📶 Excellent"
-                        elif rssi > -60:
-                            signal_quality = "📶 Good"
-                        elif rssi > -80:
-                            signal_quality = "📶 Fair"
-                        else:
-                            signal_quality = "📶 Weak"
-                    else:
-                        signal_quality = "📶 Unknown"
-                    
-                    if self.is_locked:
-                        self.logger.info(f"[Cycle {cycle:03d}] ✅ {device_name} CONNECTED | RSSI: {rssi}dBm | {signal_quality} | 🔒 Screen locked")
-                    else:
-                        self.logger.info(f"[Cycle {cycle:03d}] ✅ {device_name} CONNECTED | RSSI: {rssi}dBm | {signal_quality} | 🔓 Screen unlocked")
-                    
-                else:
-                    time_since_seen = datetime.now() - self.last_seen
-                    time_elapsed = time_since_seen.total_seconds()
-                    
-                    # Check if screen was manually unlocked
-                    actual_screen_locked = self.is_screen_locked()
-                    if self.is_locked and not actual_screen_locked:
-                        self.logger.info("🔓 Screen was manually unlocked - user is back!")
-                        self.is_locked = False
-                        
-                        # If device is still disconnected, try to reconnect immediately
-                        if (device_info is not None and 
-                            device_info.get('paired', False) and 
-                            not device_info.get('connected', False) and
-                            self.config.get('auto_reconnect', True)):
-                            
-                            self.logger.info("📱 Device still disconnected, attempting immediate reconnection...")
-                            if self.attempt_reconnect(device_info.get('address', '')):
-                                # Reconnection successful, reset timer and continue
-                                self.last_seen = datetime.now()
-                                self.reconnect_attempts = 0
-                                self.logger.info("✅ Reconnected successfully! Resetting timer.")
-                                continue
-                            else:
-                                self.logger.warning("❌ Immediate reconnection failed, starting normal timeout countdown")
-                    
-                    # Try to reconnect if device is paired but disconnected (during timeout period)
-                    if (device_info is not None and 
-                        device_info.get('paired', False) and 
-                        not device_info.get('connected', False) and
-                        self.reconnect_attempts < self.config['max_reconnect_attempts'] and
-                        time_elapsed < self.config['timeout_seconds'] and
-                        self.config.get('auto_reconnect', True)):
-                        
-                        self.reconnect_attempts += 1
-                        self.logger.info(f"🔄 Device away for {time_elapsed:.1f}s, attempting reconnection {self.reconnect_attempts}/{self.config['max_reconnect_attempts']}...")
-                        
-                        if self.attempt_reconnect(device_info.get('address', '')):
-                            # Reconnection successful, reset everything and restart monitoring cycle
-                            self.last_seen = datetime.now()
-                            self.reconnect_attempts = 0
-                            self.logger.info("✅ Device reconnected! User likely returned.")
-                            continue
-                    
-                    # Status based on how long device has been away
-                    if device_info is not None and device_info.get('paired', False):
-                        device_name = device_info.get('name', 'Device')
-                        status = f"📱 {device_name} PAIRED but disconnected"
-                        if self.reconnect_attempts > 0:
-                            status += f" (reconnect attempts: {self.reconnect_attempts}/{self.config['max_reconnect_attempts']})"
-                    elif device_info is not None:
-                        device_name = device_info.get('name', 'Device')
-                        status = f"🔍 {device_name} found but not connected"
-                    else:
-                        status = f"❌ Device NOT FOUND"
-                    
-                    remaining_time = max(0, self.config['timeout_seconds'] - time_elapsed)
-                    
-                    if time_elapsed < self.config['timeout_seconds']:
-                        screen_status = "🔒 locked" if self.is_locked else "🔓 unlocked"
-                        self.logger.info(f"[Cycle {cycle:03d}] {status} | Away: {time_elapsed:.1f}s | Lock in: {remaining_time:.1f}s | Screen: {screen_status}")
-                    else:
-                        self.logger.warning(f"[Cycle {cycle:03d}] {status} | Away: {time_elapsed:.1f}s | ⚠️  TIMEOUT REACHED!")
-                        
-                        # Reset reconnect attempts when timeout is reached
-                        if self.reconnect_attempts > 0:
-                            self.logger.info("🔄 Resetting reconnection attempts after timeout")
-                            self.reconnect_attempts = 0
-                        
-                        if not self.is_locked:
-                            self.logger.critical("🔒 LOCKING SCREEN NOW!")
-                            self.lock_screen()
-                        else:
-                            screen_status = "🔒 locked" if actual_screen_locked else "🔓 unlocked (manually)"
-                            self.logger.info(f"🔒 Screen status: {screen_status} | Device still away")
+                self.cycle += 1
+                started = self.clock.now()
+                self.budget.start()
+                device_info = self.is_device_nearby()
+                looked_up = self.clock.now()
+                self.budget.decide()
+                skip_sleep = self.run_cycle(self.cycle, device_info)
+                self.record_cycle(started, looked_up, device_info)
+                if skip_sleep:
+                    continue
                 
-                time.sleep(self.config['scan_interval'])
+                self.clock.sleep(self.next_scan_interval(device_info))
                 
         except KeyboardInterrupt:
             self.logger.info("\n🛑 Monitoring stopped by user")
+        finally:
+            self.stop_servers()
+            self.stop_recording()
+
+def print_devices(devices):
+    for device in devices:
+        status = "Connected" if device['connected'] else "Paired"
+        rssi = f" | RSSI: {device['rssi']}" if device['rssi'] != 'N/A' else ""
+        device_type = f" | Type: {device['type']}" if device['type'] != 'Unknown' else ""
+        print(f"- {device['name']} ({device['address']}) - {status}{rssi}{device_type}")
+
+def print_status(status):
+    state = "paused" if status['paused'] else "monitoring"
+    connection = "Connected" if status['connected'] else "Not connected"
+    print(f"Monitor: {state} (cycle {status['cycle']}, scan: {status['scan_reason'] or 'starting'})")
+    devices = status['trusted_devices']
+    if len(devices) == 1:
+        print(f"Device: {devices[0]['name']} ({devices[0]['address']}) - {connection}")
+    else:
+        print(f"Devices ({status['presence_policy']} of): {connection}")
+        for device in devices:
+            print(f"  - {device['name']} ({device['address']}) - {'Connected' if device['connected'] else 'Not connected'}")
+    print(f"Screen: {'🔒 locked' if status['screen_locked'] else '🔓 unlocked'}")
+    if status['lock_in'] is not None:
+        print(f"Away: {status['away_seconds']:.1f}s | Lock in: {status['lock_in']:.1f}s")
+    elif status['away_seconds']:
+        print(f"Away: {status['away_seconds']:.1f}s")
+    if status['reconnecting']:
+        print(f"Reconnecting (attempts: {status['reconnect_attempts']})")
 
 def main():
     parser = argparse.ArgumentParser(description='Mac Proximity Lock')
     parser.add_argument('--setup', action='store_true', help='Run interactive setup')
     parser.add_argument('--config', default='config.json', help='Config file path')
     parser.add_argument('--list-devices', action='store_true', help='List paired Bluetooth devices')
+    parser.add_argument('--status', action='store_true', help='Show the running monitor\'s status')
+    parser.add_argument('--control', choices=['lock', 'pause', 'resume', 'reload', 'devices', 'countdown', 'timings', 'metrics', 'trace'],
+                        help='Send a command to the running monitor')
+    parser.add_argument('--engine', choices=['sync', 'async'], default='sync', help='Monitoring engine (async races device probes concurrently)')
+    parser.add_argument('--benchmark', action='store_true', help='Measure lock latency against a simulated device')
+    parser.add_argument('--bench-latency', type=float, default=0.2, help='Simulated seconds per probe call in --benchmark')
+    parser.add_argument('--bench-fade', type=float, default=0, help='Seconds the simulated RSSI fades before the link drops in --benchmark')
+    parser.add_argument('--bench-suite', action='store_true', help='Run the benchmark regression suite (stub scenarios, fixed settings)')
+    parser.add_argument('--bench-check', action='store_true', help='Run the suite and fail if it regressed against benchmark_baseline.json')
+    parser.add_argument('--bench-save-baseline', action='store_true', help='Run the suite and save its results as benchmark_baseline.json')
+    parser.add_argument('--record', metavar='TRACE', help='Append every cycle\'s probe results to a binary trace file while monitoring')
+    parser.add_argument('--replay', metavar='TRACE', help='Replay a recorded trace through the monitor on a virtual clock')
+    parser.add_argument('--replay-grid', nargs='*', metavar='KEY=V1,V2', default=[], help='Settings to try in --replay, e.g. timeout_seconds=15,30,60 scan_interval=2,5')
+    parser.add_argument('--replay-min-away', type=float, default=60, help='Disconnects at least this many seconds long count as real departures in --replay')
+    parser.add_argument('--stats', nargs='?', const='proximity_lock.log', metavar='LOG', help='Summarize locks, away times, reconnects and RSSI from the log (only new lines are read on repeat runs)')
+    parser.add_argument('--stats-reset', action='store_true', help='Make --stats forget its checkpoint and read the whole log again')
     
     args = parser.parse_args()
     
+    if args.benchmark:
+        from benchmark import run_benchmark, format_report
+        config_path = Path(args.config)
+        base_config = json.loads(config_path.read_text()) if config_path.exists() else {}
+        print(format_report(run_benchmark(base_config, latency=args.bench_latency, engine=args.engine,
+                                         fade=args.bench_fade)))
+        return
+    
+    if args.bench_suite or args.bench_check or args.bench_save_baseline:
+        from benchmark import run_suite, format_suite, load_baseline, save_baseline, check_baseline, BASELINE_FILE
+        results = run_suite()
+        print(format_suite(results))
+        if args.bench_save_baseline:
+            save_baseline(results)
+            print(f"\nBaseline saved to {BASELINE_FILE}")
+        elif args.bench_check:
+            regressions = check_baseline(results, load_baseline())
+            if regressions:
+                print(f"\n❌ {len(regressions)} regressions against {BASELINE_FILE.name}:")
+                for regression in regressions:
+                    print(f"  {regression}")
+                raise SystemExit(1)
+            print(f"\n✅ No regressions against {BASELINE_FILE.name}")
+        return
+    
+    if args.replay:
+        from replay import replay_trace, parse_grid, format_replay
+        config_path = Path(args.config)
+        base_config = json.loads(config_path.read_text()) if config_path.exists() else {}
+        print(format_replay(replay_trace(args.replay, base_config, parse_grid(args.replay_grid),
+                                         min_away=args.replay_min_away, engine=args.engine)))
+        return
+    
+    if args.stats:
+        from log_stats import collect_stats, format_stats
+        if not Path(args.stats).exists():
+            print(f"No log file at {args.stats}")
+            raise SystemExit(1)
+        stats, read_now = collect_stats(args.stats, reset=args.stats_reset)
+        print(format_stats(stats, args.stats, read_now))
+        return
+    
+    # Queries go to the running monitor first so they don't compete with it for Bluetooth
+    socket_path = socket_path_for(args.config)
+    if args.status or args.control:
+        reply = control_request(socket_path, args.control or 'status')
+        if reply is None:
+            print(f"No monitor is running (nothing listening on {socket_path})")
+            raise SystemExit(1)
+        if not reply.get('ok'):
+            print(f"Error: {reply.get('error')}")
+            raise SystemExit(1)
+        if args.status:
+            print_status(reply)
+        elif 'text' in reply:
+            print(reply['text'], end='')
+        else:
+            print(json.dumps(reply, indent=2))
+        return
+    
+    if args.list_devices:
+        reply = control_request(socket_path, 'devices')
+        if reply is not None and reply.get('ok'):
+            print("Devices known to the running monitor:")
+            print_devices(reply['devices'])
+            return
+    
     lock = ProximityLock(args.config)
     
     if args.setup:
         lock.run_setup()
     elif args.list_devices:
         print("Scanning for Bluetooth devices...")
-        devices = lock.scan_bluetooth_devices()
-        for device in devices:
-            status = "Connected" if device['connected'] else "Paired"
-            rssi = f" | RSSI: {device['rssi']}" if device['rssi'] != 'N/A' else ""
-            device_type = f" | Type: {device['type']}" if device['type'] != 'Unknown' else ""
-            print(f"- {device['name']} ({device['address']}) - {status}{rssi}{device_type}")
+        print_devices(lock.scan_bluetooth_devices())
     else:
-        lock.monitor()
+        if args.record:
+            from probe_trace import TraceWriter
+            lock.recorder = TraceWriter(args.record)
+        if args.engine == 'async':
+            from async_engine import run_async_monitor
+            run_async_monitor(lock)
+        else:
+            lock.monitor()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,206 @@
+"""
+Instrumentation for Mac Proximity Lock.
+
+Probes (blueutil lookups, screen-lock checks, reconnects, lock actions)
+and cycle phases are timed into fixed-bucket latency histograms with
+per-outcome counters; events such as cycle budget overruns are plain
+counters. Everything is a few integer updates under one lock, so it stays
+on in production. The numbers are served in Prometheus text format on
+localhost and summarized periodically in the log.
+"""
+
+import bisect
+import logging
+import subprocess
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+OUTCOMES = ('ok', 'error', 'timeout')
+
+TIMEOUT_ERRORS = (subprocess.TimeoutExpired, TimeoutError)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # Last slot counts observations above the largest bound (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (None if empty)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class ProbeTimer:
+    """Context manager returned by Metrics.probe(); call fail() to record a caught failure"""
+
+    __slots__ = ('metrics', 'name', 'started', 'outcome')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.outcome = 'ok'
+
+    def __enter__(self):
+        self.started = self.metrics.clock.now()
+        return self
+
+    def fail(self, error=None):
+        """Record the probe as failed; timeouts are told apart by exception type"""
+        self.outcome = 'timeout' if isinstance(error, TIMEOUT_ERRORS) else 'error'
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            if issubclass(exc_type, Exception):
+                self.fail(exc)
+            else:
+                # Cancelled (a losing async lookup) or interrupted
+                self.outcome = 'cancelled'
+        seconds = (self.metrics.clock.now() - self.started).total_seconds()
+        self.metrics.observe(self.name, seconds, self.outcome)
+        return False
+
+
+class Metrics:
+    """Per-probe outcome counters and latency histograms"""
+
+    def __init__(self, clock, buckets=LATENCY_BUCKETS):
+        self.clock = clock
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.outcomes = {}
+        self.counters = {}
+
+    def probe(self, name):
+        """Time a block: `with metrics.probe('lock_screen') as probe: ...`"""
+        return ProbeTimer(self, name)
+
+    def observe(self, name, seconds, outcome='ok'):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.buckets)
+                self.outcomes[name] = dict.fromkeys(OUTCOMES, 0)
+            histogram.observe(seconds)
+            self.outcomes[name][outcome] = self.outcomes[name].get(outcome, 0) + 1
+
+    def count(self, name, n=1):
+        """Add n to a plain event counter"""
+        if not n:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def render(self, gauges=None):
+        """Prometheus text exposition of every probe, plus optional gauges"""
+        lines = [
+            "# HELP proximity_lock_probe_seconds Latency of probes and monitor cycle phases",
+            "# TYPE proximity_lock_probe_seconds histogram",
+        ]
+        with self.lock:
+            for name in sorted(self.histograms):
+                histogram = self.histograms[name]
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'proximity_lock_probe_seconds_bucket{{probe="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'proximity_lock_probe_seconds_bucket{{probe="{name}",le="+Inf"}} {histogram.count}')
+                lines.append(f'proximity_lock_probe_seconds_sum{{probe="{name}"}} {histogram.sum:.6f}')
+                lines.append(f'proximity_lock_probe_seconds_count{{probe="{name}"}} {histogram.count}')
+
+            lines.append("# HELP proximity_lock_probe_total Probe calls by outcome")
+            lines.append("# TYPE proximity_lock_probe_total counter")
+            for name in sorted(self.outcomes):
+                for outcome, count in self.outcomes[name].items():
+                    lines.append(f'proximity_lock_probe_total{{probe="{name}",outcome="{outcome}"}} {count}')
+            for name in sorted(self.counters):
+                lines.append(f"# TYPE proximity_lock_{name}_total counter")
+                lines.append(f"proximity_lock_{name}_total {self.counters[name]}")
+
+        for name, value in (gauges or {}).items():
+            lines.append(f"# TYPE proximity_lock_{name} gauge")
+            lines.append(f"proximity_lock_{name} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """One-line digest for the periodic log entry"""
+        parts = []
+        with self.lock:
+            for name in sorted(self.histograms):
+                histogram = self.histograms[name]
+                outcomes = self.outcomes[name]
+                part = f"{name} {histogram.count}x p50≤{histogram.quantile(0.5)}s p99≤{histogram.quantile(0.99)}s"
+                failures = outcomes['error'] + outcomes['timeout']
+                if failures:
+                    part += f" ({outcomes['error']} errors, {outcomes['timeout']} timeouts)"
+                parts.append(part)
+            for name in sorted(self.counters):
+                parts.append(f"{name} {self.counters[name]}")
+        return " | ".join(parts)
+
+
+class MetricsServer:
+    """Serves Metrics.render() at http://127.0.0.1:<port>/metrics"""
+
+    def __init__(self, render, port, host='127.0.0.1'):
+        self.render = render
+        self.address = (host, port)
+        self.server = None
+
+    def start(self):
+        # Only a monitor with metrics_port set pays for importing the HTTP server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        render = self.render
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer(self.address, Handler)
+        except OSError as e:
+            logger.error(f"Could not start metrics endpoint on {self.address[0]}:{self.address[1]}: {e}")
+            return False
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='metrics-http', daemon=True).start()
+        logger.info(f"📊 Metrics at http://{self.address[0]}:{self.address[1]}/metrics")
+        return True
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
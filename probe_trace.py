@@ -0,0 +1,128 @@
+"""
+Binary probe traces for Mac Proximity Lock.
+
+`--record` appends one fixed-size record per monitor cycle: the timestamp,
+whether the target was found, connected and paired, its RSSI and the
+screen-lock state if known. At 10 bytes a record, a week of 5-second cycles
+is about 1.2 MB. Records are only ever appended, so a trace survives the
+monitor being killed mid-write (a torn last record is ignored on read).
+"""
+
+import collections
+import struct
+from pathlib import Path
+
+from backends import PresenceTimeline
+
+TRACE_MAGIC = b'PLTRACE1'
+# timestamp (epoch seconds), rssi (dBm), flags
+RECORD = struct.Struct('<dbB')
+RSSI_UNKNOWN = -128
+
+FOUND = 0x01
+CONNECTED = 0x02
+PAIRED = 0x04
+SCREEN_KNOWN = 0x08
+SCREEN_LOCKED = 0x10
+
+TraceRecord = collections.namedtuple(
+    'TraceRecord', 'timestamp found connected paired rssi screen_locked')
+
+
+class TraceWriter:
+    """Appends probe results to a trace file"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        if self.path.exists() and self.path.stat().st_size:
+            with open(self.path, 'rb') as f:
+                if f.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+                    raise ValueError(f"{self.path} is not a probe trace")
+        self.file = open(self.path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(TRACE_MAGIC)
+
+    def append(self, timestamp, device_info, screen_locked=None):
+        flags = 0
+        rssi = RSSI_UNKNOWN
+        if device_info:
+            flags |= FOUND
+            if device_info.get('connected'):
+                flags |= CONNECTED
+            if device_info.get('paired'):
+                flags |= PAIRED
+            value = device_info.get('rssi')
+            if isinstance(value, (int, float)):
+                rssi = max(-127, min(127, int(value)))
+        if screen_locked is not None:
+            flags |= SCREEN_KNOWN
+            if screen_locked:
+                flags |= SCREEN_LOCKED
+        self.file.write(RECORD.pack(timestamp, rssi, flags))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_trace(path):
+    """Return the trace's records as a list of TraceRecord"""
+    data = Path(path).read_bytes()
+    if not data.startswith(TRACE_MAGIC):
+        raise ValueError(f"{path} is not a probe trace")
+    body = memoryview(data)[len(TRACE_MAGIC):]
+    body = body[:len(body) - len(body) % RECORD.size]
+    records = []
+    for timestamp, rssi, flags in RECORD.iter_unpack(body):
+        records.append(TraceRecord(
+            timestamp,
+            bool(flags & FOUND),
+            bool(flags & CONNECTED),
+            bool(flags & PAIRED),
+            None if rssi == RSSI_UNKNOWN else rssi,
+            bool(flags & SCREEN_LOCKED) if flags & SCREEN_KNOWN else None,
+        ))
+    return records
+
+
+def away_episodes(records):
+    """(start, end) seconds from the first record for every stretch the device was not connected"""
+    if not records:
+        return []
+    origin = records[0].timestamp
+    episodes = []
+    start = None
+    for record in records:
+        if not record.connected and start is None:
+            start = record.timestamp - origin
+        elif record.connected and start is not None:
+            episodes.append((start, record.timestamp - origin))
+            start = None
+    if start is not None:
+        episodes.append((start, records[-1].timestamp - origin))
+    return episodes
+
+
+def trace_timeline(records, min_away=60):
+    """Turn a trace into a PresenceTimeline for FakeBackend.
+
+    Disconnects shorter than min_away seconds are taken as link drops with
+    the user still nearby ('dropped', so a reconnect succeeds); longer ones
+    as real departures ('away').
+    """
+    origin = records[0].timestamp if records else 0.0
+    departures = set(start for start, end in away_episodes(records) if end - start >= min_away)
+    steps = []
+    previous = None
+    for record in records:
+        seconds = record.timestamp - origin
+        if record.connected:
+            step = ('connected', record.rssi if record.rssi is not None else -50)
+        elif previous is None or previous[0] == 'connected':
+            step = ('away' if seconds in departures else 'dropped', None)
+        else:
+            step = previous
+        if step != previous:
+            steps.append((seconds,) + step)
+            previous = step
+    return PresenceTimeline(steps)
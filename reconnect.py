@@ -0,0 +1,141 @@
+"""
+Background reconnection for Mac Proximity Lock.
+
+`blueutil --connect` can take up to 10 seconds. ReconnectWorker runs those
+attempts off the monitor loop, spacing retries with exponential backoff and
+jitter based on reconnect_delay, and hands each outcome back as an event the
+loop picks up on its next cycle.
+"""
+
+import collections
+import random
+import threading
+from datetime import timedelta
+
+ReconnectEvent = collections.namedtuple(
+    'ReconnectEvent', 'address attempt success duration retry_in at')
+
+
+class ReconnectWorker:
+    """Runs reconnect attempts for one device at a time in the background.
+
+    connect(address) performs a single attempt and returns True on success.
+    With threaded=False (simulated clocks) due attempts run when poll() is
+    called, timed on a detached clock so they still don't stall the cycle.
+    """
+
+    def __init__(self, connect, clock, base_delay=2, max_attempts=3, max_delay=30,
+                 jitter=0.3, threaded=True, rng=None):
+        self.connect = connect
+        self.clock = clock
+        self.base_delay = base_delay
+        self.max_attempts = max_attempts
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.threaded = threaded
+        self.rng = rng or random.Random()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.events = collections.deque()
+        self.job = None
+        self.thread = None
+
+    def backoff(self, attempt):
+        """Delay before the attempt after `attempt`: doubling, capped, jittered"""
+        delay = min(self.base_delay * (2 ** (attempt - 1)), self.max_delay)
+        return max(0.0, delay * (1 + self.rng.uniform(-self.jitter, self.jitter)))
+
+    def active(self):
+        """True from request() until the final event for it has been polled"""
+        with self.lock:
+            return self.job is not None
+
+    def request(self, address, immediate=False):
+        """Start reconnecting to address unless that is already in progress"""
+        with self.lock:
+            if self.job is not None and self.job['address'] == address and not self.job['finished']:
+                if immediate:
+                    self.job['next_at'] = self.clock.now()
+                else:
+                    return False
+            else:
+                self.job = {'address': address, 'attempt': 0, 'next_at': self.clock.now(),
+                            'finished': False}
+
+        if not self.threaded:
+            self._run_due()
+        else:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._loop, name='reconnect-worker', daemon=True)
+                self.thread.start()
+            self.wake.set()
+        return True
+
+    def cancel(self):
+        """Stop retrying (device came back, or the lock timeout was reached)"""
+        with self.lock:
+            self.job = None
+            # Results of cancelled attempts are not reported
+            self.events.clear()
+        self.wake.set()
+
+    def poll(self):
+        """Return the reconnect events that have completed by now"""
+        if not self.threaded:
+            self._run_due()
+        now = self.clock.now()
+        ready = []
+        while self.events and self.events[0].at <= now:
+            ready.append(self.events.popleft())
+        with self.lock:
+            if self.job is not None and self.job['finished'] and not self.events:
+                self.job = None
+        return ready
+
+    def _finish(self, job, success, started, finished):
+        retry_in = None
+        with self.lock:
+            if self.job is not job:
+                # Cancelled while the attempt ran: the device is back, monitoring
+                # paused or the lock timeout passed, so the result is stale
+                return
+            if success or job['attempt'] >= self.max_attempts:
+                job['finished'] = True
+            else:
+                retry_in = self.backoff(job['attempt'])
+                job['next_at'] = finished + timedelta(seconds=retry_in)
+            self.events.append(ReconnectEvent(job['address'], job['attempt'], success,
+                                              (finished - started).total_seconds(), retry_in, finished))
+
+    def _attempt(self, job):
+        job['attempt'] += 1
+        started = self.clock.now()
+        success = self.connect(job['address'])
+        self._finish(job, success, started, self.clock.now())
+
+    def _run_due(self):
+        with self.lock:
+            job = self.job
+        if job is None or job['finished'] or job['next_at'] > self.clock.now():
+            return
+        job['attempt'] += 1
+        started = self.clock.now()
+        with self.clock.detached() as timer:
+            success = self.connect(job['address'])
+        self._finish(job, success, started, started + timedelta(seconds=timer.elapsed))
+
+    def _loop(self):
+        while True:
+            with self.lock:
+                job = self.job
+            if job is None or job['finished']:
+                self.wake.wait()
+                self.wake.clear()
+                continue
+            delay = (job['next_at'] - self.clock.now()).total_seconds()
+            if delay > 0:
+                # Woken early by cancel() or an immediate request
+                self.wake.wait(delay)
+                self.wake.clear()
+                continue
+            self._attempt(job)
@@ -0,0 +1,132 @@
+"""
+Trace replay for Mac Proximity Lock.
+
+Feeds a recorded probe trace (see probe_trace.py) through the real monitor
+loop on a virtual clock, once per combination of settings in a grid, and
+reports for each how many locks were false (during a short link drop) and
+how long real departures took to lock.
+"""
+
+import itertools
+import json
+import time
+
+from backends import FakeBackend, VirtualClock
+from benchmark import BENCH_DEVICE_MAC, BENCH_DEVICE_NAME, percentile, simulate
+from probe_trace import away_episodes, read_trace, trace_timeline
+
+# A lock this long before the link drops still counts for that departure (early lock)
+EARLY_LOCK_LOOKBACK = 60
+
+
+def parse_grid(specs):
+    """Parse ["timeout_seconds=15,30", ...] into {key: [values]}"""
+    grid = {}
+    for spec in specs or []:
+        key, sep, values = spec.partition('=')
+        if not sep or not values:
+            raise ValueError(f"Expected key=value[,value...], got: {spec}")
+        grid[key.strip()] = [json.loads(value) for value in values.split(',')]
+    return grid
+
+
+def grid_settings(grid):
+    """Every combination of the grid's values, as config override dicts"""
+    keys = sorted(grid)
+    for values in itertools.product(*(grid[key] for key in keys)):
+        yield dict(zip(keys, values))
+
+
+def score_locks(lock_times, departures, blips):
+    """Match lock times to departures; locks that match none are false locks"""
+    delays = []
+    matched = set()
+    for start, end in departures:
+        for t in lock_times:
+            if start - EARLY_LOCK_LOOKBACK <= t < end and t not in matched:
+                matched.add(t)
+                delays.append(t - start)
+                break
+    false_locks = [t for t in lock_times if t not in matched]
+    return {
+        'locks': len(lock_times),
+        'false_locks': len(false_locks),
+        'false_locks_in_drops': sum(1 for t in false_locks
+                                    if any(start <= t < end for start, end in blips)),
+        'departures_locked': len(delays),
+        'departures_missed': len(departures) - len(delays),
+        'lock_delay_mean': sum(delays) / len(delays) if delays else None,
+        'lock_delay_p50': percentile(delays, 50) if delays else None,
+        'lock_delay_max': max(delays) if delays else None,
+    }
+
+
+def replay_trace(path, base_config=None, grid=None, min_away=60, engine='sync'):
+    """Replay the trace once per grid setting and return a results dict"""
+    records = read_trace(path)
+    if len(records) < 2:
+        raise ValueError(f"{path} has too few records to replay")
+    duration = records[-1].timestamp - records[0].timestamp
+    episodes = away_episodes(records)
+    departures = [(start, end) for start, end in episodes if end - start >= min_away]
+    blips = [(start, end) for start, end in episodes if end - start < min_away]
+    timeline = trace_timeline(records, min_away)
+
+    runs = []
+    started = time.perf_counter()
+    for overrides in grid_settings(grid or {}):
+        config = dict(base_config or {})
+        config.update(overrides)
+        config['device_name'] = BENCH_DEVICE_NAME
+        config['device_mac'] = BENCH_DEVICE_MAC
+        config['devices'] = []
+        run_started = time.perf_counter()
+        clock = VirtualClock(end_after=duration)
+        backend = FakeBackend(name=BENCH_DEVICE_NAME, address=BENCH_DEVICE_MAC,
+                              timeline=timeline, clock=clock)
+        lock = simulate(config, backend, clock, engine)
+        result = score_locks(backend.lock_times, departures, blips)
+        result.update({
+            'settings': overrides,
+            'cycles': lock.cycle,
+            'calls': len(backend.calls),
+            'wall_seconds': time.perf_counter() - run_started,
+        })
+        runs.append(result)
+
+    return {
+        'trace': str(path),
+        'records': len(records),
+        'duration': duration,
+        'departures': len(departures),
+        'drops': len(blips),
+        'min_away': min_away,
+        'wall_seconds': time.perf_counter() - started,
+        'runs': runs,
+    }
+
+
+def _seconds(value):
+    return "-" if value is None else f"{value:.1f}s"
+
+
+def format_replay(results):
+    """Render replay results for the terminal"""
+    hours = results['duration'] / 3600
+    speedup = results['duration'] * len(results['runs']) / max(results['wall_seconds'], 1e-9)
+    lines = ["=== Mac Proximity Lock Replay ==="]
+    lines.append(f"Trace:        {results['trace']} ({results['records']} records, {hours:.1f}h)")
+    lines.append(f"Departures:   {results['departures']} (away >= {results['min_away']}s) | "
+                 f"link drops: {results['drops']}")
+    lines.append(f"Replayed:     {len(results['runs'])} settings in {results['wall_seconds']:.2f}s "
+                 f"({speedup:,.0f}x real time)")
+    lines.append("")
+    for run in results['runs']:
+        settings = ", ".join(f"{key}={value}" for key, value in run['settings'].items()) or "config.json"
+        lines.append(f"[{settings}]")
+        lines.append(f"  False locks: {run['false_locks']} ({run['false_locks_in_drops']} during link drops) | "
+                     f"departures locked {run['departures_locked']}, missed {run['departures_missed']}")
+        lines.append(f"  Lock delay:  mean {_seconds(run['lock_delay_mean'])} | "
+                     f"p50 {_seconds(run['lock_delay_p50'])} | max {_seconds(run['lock_delay_max'])} | "
+                     f"{run['cycles']} cycles, {run['calls']} probe calls")
+    return "\n".join(lines)
@@ -0,0 +1,133 @@
+"""
+RSSI history and departure prediction for Mac Proximity Lock.
+
+Each device gets a fixed-size ring buffer of (time, filtered RSSI) samples
+backed by array('d'), smoothed with either an EWMA or a 1-D Kalman filter.
+DeparturePredictor looks at the filtered level and its least-squares slope
+to tell when the user is walking away, so the lock countdown can start
+before Bluetooth finally drops the link.
+"""
+
+from array import array
+
+
+class RssiHistory:
+    """Fixed-size, array-backed ring buffer of filtered RSSI samples"""
+
+    def __init__(self, size=32, smoothing='kalman', alpha=0.3,
+                 process_noise=4.0, measurement_noise=16.0):
+        if smoothing not in ('kalman', 'ewma'):
+            raise ValueError(f"Unknown RSSI smoothing: {smoothing}")
+        self.size = size
+        self.smoothing = smoothing
+        self.alpha = alpha
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.times = array('d', bytes(8 * size))
+        self.filtered = array('d', bytes(8 * size))
+        self.count = 0
+        self.head = 0
+        self.estimate = None
+        self.variance = measurement_noise
+
+    def clear(self):
+        self.count = 0
+        self.head = 0
+        self.estimate = None
+        self.variance = self.measurement_noise
+
+    def _smooth(self, rssi):
+        if self.estimate is None:
+            self.estimate = float(rssi)
+        elif self.smoothing == 'ewma':
+            self.estimate += self.alpha * (rssi - self.estimate)
+        else:
+            # Random-walk Kalman filter: predict, then correct with the reading
+            self.variance += self.process_noise
+            gain = self.variance / (self.variance + self.measurement_noise)
+            self.estimate += gain * (rssi - self.estimate)
+            self.variance *= (1.0 - gain)
+        return self.estimate
+
+    def add(self, timestamp, rssi):
+        """Record a reading and return its filtered value"""
+        value = self._smooth(rssi)
+        self.times[self.head] = timestamp
+        self.filtered[self.head] = value
+        self.head = (self.head + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+        return value
+
+    def latest(self):
+        """Most recent filtered RSSI, or None when empty"""
+        return self.estimate if self.count else None
+
+    def latest_time(self):
+        return self.times[(self.head - 1) % self.size] if self.count else None
+
+    def slope(self, window_seconds=None):
+        """Least-squares slope of the filtered RSSI in dB/s over the window"""
+        if self.count < 2:
+            return 0.0
+        newest = self.latest_time()
+        n = 0
+        sum_t = sum_y = 0.0
+        for i in range(self.count):
+            index = (self.head - 1 - i) % self.size
+            t = self.times[index] - newest
+            if window_seconds is not None and -t > window_seconds:
+                break
+            n += 1
+            sum_t += t
+            sum_y += self.filtered[index]
+        if n < 2:
+            return 0.0
+        mean_t = sum_t / n
+        mean_y = sum_y / n
+        covariance = variance = 0.0
+        for i in range(n):
+            index = (self.head - 1 - i) % self.size
+            dt = self.times[index] - newest - mean_t
+            covariance += dt * (self.filtered[index] - mean_y)
+            variance += dt * dt
+        return covariance / variance if variance else 0.0
+
+    def samples_since(self, window_seconds):
+        if not self.count:
+            return 0
+        cutoff = self.latest_time() - window_seconds
+        n = 0
+        for i in range(self.count):
+            if self.times[(self.head - 1 - i) % self.size] < cutoff:
+                break
+            n += 1
+        return n
+
+
+class DeparturePredictor:
+    """Decides from a device's RSSI history whether the user is walking away"""
+
+    def __init__(self, slope_threshold=-0.75, rssi_threshold=-65, window_seconds=20,
+                 min_samples=4, recovery_margin=3):
+        self.slope_threshold = slope_threshold
+        self.rssi_threshold = rssi_threshold
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.recovery_margin = recovery_margin
+
+    def is_departing(self, history):
+        """True when the filtered signal is weak and falling steadily"""
+        if history.samples_since(self.window_seconds) < self.min_samples:
+            return False
+        level = history.latest()
+        return (level <= self.rssi_threshold and
+                history.slope(self.window_seconds) <= self.slope_threshold)
+
+    def has_recovered(self, history):
+        """True once the signal is clearly back up or rising again"""
+        level = history.latest()
+        if level is None:
+            return False
+        return (level > self.rssi_threshold + self.recovery_margin or
+                history.slope(self.window_seconds) > 0)
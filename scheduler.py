@@ -0,0 +1,85 @@
+"""
+Adaptive scan scheduling for Mac Proximity Lock.
+
+Replaces the fixed scan_interval sleep: polls rarely while the device is
+connected with a strong, steady signal, quickly when the signal is falling
+or the device has just dropped, and faster still as the lock timeout nears so
+the lock fires close to timeout_seconds. The away clock starts at the last
+connected scan, so even while connected the interval is kept to a fraction
+of the timeout; otherwise a long sleep would eat into the grace period.
+"""
+
+# RSSI at or above this counts as strong enough to back off
+RSSI_STRONG = -60
+# RSSI at or below this is treated as about to drop
+RSSI_WEAK = -70
+# A reading this many dB under the running average means the signal is falling
+RSSI_DROP = 6
+# Smoothing factor for the running RSSI average
+RSSI_ALPHA = 0.3
+# Multiplier applied to the interval for each stable connected cycle
+BACKOFF = 1.5
+# Longest connected interval as a share of the lock timeout in effect
+TIMEOUT_SHARE = 0.25
+
+
+class AdaptiveScheduler:
+    """Chooses the sleep before the next scan from the current device state"""
+
+    def __init__(self, scan_interval, min_interval, max_interval, timeout):
+        self.min_interval = max(0.1, min(min_interval, max_interval))
+        self.max_interval = max(self.min_interval, max_interval)
+        self.base_interval = min(max(scan_interval, self.min_interval), self.max_interval)
+        self.timeout = timeout
+        self.interval = self.base_interval
+        self.rssi_average = None
+        self.was_connected = None
+
+    def _connected_interval(self, rssi, timeout):
+        interval, reason = self._backoff_interval(rssi)
+        # At most a quarter of the timeout goes by unobserved before the device is missed
+        return min(interval, max(self.min_interval, timeout * TIMEOUT_SHARE)), reason
+
+    def _backoff_interval(self, rssi):
+        if not isinstance(rssi, (int, float)):
+            return self.base_interval, "connected"
+
+        falling = self.rssi_average is not None and rssi < self.rssi_average - RSSI_DROP
+        if self.rssi_average is None:
+            self.rssi_average = float(rssi)
+        else:
+            self.rssi_average += RSSI_ALPHA * (rssi - self.rssi_average)
+
+        if falling:
+            return self.min_interval, "RSSI falling"
+        if rssi <= RSSI_WEAK:
+            return self.min_interval, "weak signal"
+        if self.was_connected and rssi >= RSSI_STRONG:
+            interval = max(self.interval, self.base_interval) * BACKOFF
+            return min(interval, self.max_interval), "stable"
+        return self.base_interval, "connected"
+
+    def _away_interval(self, time_elapsed, locked, timeout):
+        remaining = timeout - time_elapsed
+        if locked or remaining <= 0:
+            return self.base_interval, "waiting for return"
+        if self.was_connected:
+            interval, reason = self.min_interval, "just disconnected"
+        else:
+            # Tighten the polling as the countdown runs out
+            interval = min(max(remaining / 4, self.min_interval), self.base_interval)
+            reason = "countdown"
+        # Never sleep past the moment the lock is due
+        return min(interval, remaining), reason
+
+    def next_interval(self, connected, rssi, time_elapsed, locked, timeout=None):
+        """Return (seconds, reason) to sleep before the next scan"""
+        timeout = self.timeout if timeout is None else timeout
+        if connected:
+            interval, reason = self._connected_interval(rssi, timeout)
+        else:
+            self.rssi_average = None
+            interval, reason = self._away_interval(time_elapsed, locked, timeout)
+        self.was_connected = bool(connected)
+        self.interval = interval
+        return interval, reason
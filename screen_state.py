@@ -0,0 +1,150 @@
+"""
+Screen-lock state detection for Mac Proximity Lock.
+
+The best available detection method is resolved once instead of on every
+call: lock/unlock notifications when PyObjC can subscribe to them, otherwise
+Quartz, otherwise the ioreg/pgrep/osascript probe chain. Probe results are
+cached for a short TTL, and the provider counts how many probes ran and how
+long they took.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROBE_CHAIN = ('ioreg', 'pgrep', 'osascript')
+
+PROBE_COMMANDS = {
+    'ioreg': (['ioreg', '-n', 'IOHIDSystem', '-d1'], 3),
+    'pgrep': (['pgrep', 'ScreenSaverEngine'], 2),
+    'osascript': (['osascript', '-e', 'tell application "System Events" to get name of first desktop'], 2),
+}
+
+
+class ScreenLockState:
+    """Resolves, caches and counts screen-lock state lookups"""
+
+    def __init__(self, backend, clock, ttl=3.0, notifications=True):
+        self.backend = backend
+        self.clock = clock
+        self.ttl = ttl
+        self.use_notifications = notifications
+        self.method = None
+        self.chain = list(PROBE_CHAIN)
+        self.cached = None
+        self.cached_at = None
+        self.notified = None
+        self.probes = 0
+        self.probe_seconds = 0.0
+        self.cache_hits = 0
+        self.notifications = 0
+        self.failures = 0
+
+    def resolve(self):
+        """Pick the detection method once; later calls reuse it"""
+        if self.method is not None:
+            return self.method
+
+        # Seed the state first so notifications only have to report changes
+        try:
+            session = self.backend.quartz_session()
+            self.method = 'quartz' if session else 'probe'
+            if session:
+                self.remember(session.get('CGSSessionScreenIsLocked', False))
+        except ImportError:
+            logger.debug("PyObjC/Quartz not available, using ioreg/pgrep/osascript probes")
+            self.method = 'probe'
+
+        if self.use_notifications and self.backend.subscribe_screen_lock(self.on_notification):
+            logger.info(f"🔔 Screen lock state: notifications (seeded by {self.method})")
+            self.method = f"notifications+{self.method}"
+        else:
+            logger.info(f"🖥️  Screen lock state: {self.method} (cached {self.ttl}s)")
+        return self.method
+
+    def on_notification(self, locked):
+        """Called by the backend when the screen is locked or unlocked"""
+        self.notifications += 1
+        self.notified = bool(locked)
+        self.remember(locked)
+
+    def remember(self, locked):
+        """Record a known state, e.g. right after we locked the screen ourselves"""
+        self.cached = bool(locked)
+        self.cached_at = self.clock.now()
+
+    def last_known(self):
+        """Lock state without probing: notified, or cached within the TTL; None if unknown"""
+        if self.notified is not None:
+            return self.notified
+        if self.cached_at is not None and (self.clock.now() - self.cached_at).total_seconds() < self.ttl:
+            return self.cached
+        return None
+
+    def is_locked(self, fallback=False):
+        """Current lock state; fallback is returned when every method fails"""
+        method = self.resolve()
+
+        if self.notified is not None:
+            return self.notified
+
+        if self.cached_at is not None:
+            if (self.clock.now() - self.cached_at).total_seconds() < self.ttl:
+                self.cache_hits += 1
+                return self.cached
+
+        started = self.clock.now()
+        try:
+            if method.endswith('quartz'):
+                locked = self._probe_quartz()
+            else:
+                locked = self._probe_chain()
+        except Exception as e:
+            self.failures += 1
+            logger.debug(f"All screen lock detection methods failed: {e}")
+            return fallback
+        finally:
+            self.probe_seconds += (self.clock.now() - started).total_seconds()
+
+        self.remember(locked)
+        return locked
+
+    def _probe_quartz(self):
+        self.probes += 1
+        session = self.backend.quartz_session()
+        return bool(session and session.get('CGSSessionScreenIsLocked', False))
+
+    def _probe_chain(self):
+        for name in list(self.chain):
+            args, timeout = PROBE_COMMANDS[name]
+            self.probes += 1
+            try:
+                result = self.backend.run(args, timeout=timeout)
+            except FileNotFoundError:
+                # Not installed here - never try it again
+                logger.debug(f"{name} not available, dropping it from screen lock probes")
+                self.chain.remove(name)
+                continue
+
+            if name == 'ioreg':
+                # HIDIdleTime present and accessible - screen likely unlocked
+                if result.returncode == 0 and 'HIDIdleTime' in result.stdout:
+                    return False
+            elif name == 'pgrep':
+                if result.returncode == 0:
+                    return True  # Screensaver is running
+            else:
+                # If osascript can reach the window server, screen is probably not locked
+                return result.returncode != 0
+
+        raise RuntimeError("no screen lock probe gave an answer")
+
+    def stats(self):
+        return {
+            'method': self.method,
+            'probes': self.probes,
+            'probe_seconds': self.probe_seconds,
+            'cache_hits': self.cache_hits,
+            'notifications': self.notifications,
+            'failures': self.failures,
+        }
@@ -0,0 +1,138 @@
+"""
+Validated settings for Mac Proximity Lock.
+
+config.json is checked when it is loaded or reloaded, and the values the
+monitor would otherwise re-derive every cycle (normalized MACs, lowercased
+names, the parsed lock actions, the log level) are computed once into a
+Settings object. A reload builds the complete new Settings before anything
+is switched over, so an edit with a bad value never leaves the monitor
+half-reconfigured.
+"""
+
+import logging
+
+from device_query import PRESENCE_POLICIES, configured_targets
+from lock_actions import parse_lock_actions
+
+LOG_MODES = ('cycles', 'transitions')
+RSSI_SMOOTHING = ('kalman', 'ewma')
+LOG_ROTATE_WHEN = ('', 'S', 'M', 'H', 'D', 'midnight') + tuple(f"W{day}" for day in range(7))
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+# Numeric keys: (minimum, whether it must be a whole number)
+NUMBERS = {
+    'timeout_seconds': (0.001, False),
+    'scan_interval': (0.001, False),
+    'cycle_budget_seconds': (0, False),
+    'max_reconnect_attempts': (0, True),
+    'reconnect_delay': (0, False),
+    'reconnect_max_delay': (0, False),
+    'reconnect_jitter': (0, False),
+    'paired_cache_ttl': (0, False),
+    'async_hedge_delay': (0, False),
+    'min_scan_interval': (0.001, False),
+    'max_scan_interval': (0.001, False),
+    'screen_state_ttl': (0, False),
+    'rssi_history_size': (2, True),
+    'early_lock_timeout': (0, False),
+    'early_lock_slope': (None, False),
+    'early_lock_rssi': (None, False),
+    'early_lock_window': (0.001, False),
+    'metrics_port': (0, True),
+    'metrics_log_interval': (0, False),
+    'log_heartbeat_interval': (0, False),
+    'log_max_bytes': (0, True),
+    'log_backup_count': (0, True),
+    'trace_size': (1, True),
+}
+
+BOOLEANS = ('auto_reconnect', 'adaptive_scan', 'screen_lock_notifications', 'early_lock', 'watch_config')
+
+STRINGS = ('device_name', 'device_mac', 'lock_command', 'control_socket')
+
+CHOICES = {
+    'presence_policy': PRESENCE_POLICIES,
+    'log_mode': LOG_MODES,
+    'rssi_smoothing': RSSI_SMOOTHING,
+    'log_rotate_when': LOG_ROTATE_WHEN,
+}
+
+# Keys validated against each other: an invalid combination is reset together
+RELATED_KEYS = {
+    'min_scan_interval': ('max_scan_interval',),
+    'max_scan_interval': ('min_scan_interval',),
+}
+
+# Only read when the monitor starts; changing them needs a restart
+RESTART_KEYS = ('control_socket', 'metrics_port', 'log_max_bytes', 'log_backup_count',
+                'log_rotate_when', 'trace_size')
+
+
+class ConfigError(ValueError):
+    """Raised for a config with invalid values; errors maps each bad key to what is wrong"""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(f"{key}: {message}" for key, message in errors.items()))
+        self.errors = errors
+
+
+def validate_config(config):
+    """Return {key: problem} for every invalid value in a (defaults-merged) config"""
+    errors = {}
+    for key, (minimum, whole) in NUMBERS.items():
+        value = config.get(key)
+        if isinstance(value, bool) or not isinstance(value, int if whole else (int, float)):
+            errors[key] = f"expected {'a whole number' if whole else 'a number'}, got {value!r}"
+        elif minimum is not None and value < minimum:
+            errors[key] = f"must be at least {minimum}, got {value!r}"
+    for key in BOOLEANS:
+        if not isinstance(config.get(key), bool):
+            errors[key] = f"expected true or false, got {config.get(key)!r}"
+    for key in STRINGS:
+        if not isinstance(config.get(key), str):
+            errors[key] = f"expected a string, got {config.get(key)!r}"
+    for key, choices in CHOICES.items():
+        if config.get(key) not in choices:
+            errors[key] = f"expected one of {', '.join(repr(choice) for choice in choices)}, got {config.get(key)!r}"
+
+    level = config.get('log_level')
+    if not isinstance(level, str) or level.upper() not in LOG_LEVELS:
+        errors['log_level'] = f"expected one of {', '.join(LOG_LEVELS)}, got {level!r}"
+    if 'lock_command' not in errors and not config['lock_command'].split():
+        errors['lock_command'] = "must not be empty"
+    if 'reconnect_jitter' not in errors and config['reconnect_jitter'] > 1:
+        errors['reconnect_jitter'] = f"must be at most 1, got {config['reconnect_jitter']!r}"
+    if ('min_scan_interval' not in errors and 'max_scan_interval' not in errors and
+            config['min_scan_interval'] > config['max_scan_interval']):
+        errors['min_scan_interval'] = "must not be larger than max_scan_interval"
+
+    devices = config.get('devices')
+    if not isinstance(devices, list) or not all(
+            isinstance(entry, dict) and set(entry) <= {'name', 'mac'} and
+            all(isinstance(value, str) for value in entry.values()) for entry in devices):
+        errors['devices'] = 'expected a list of {"name": ..., "mac": ...} objects'
+
+    if 'lock_command' not in errors:
+        try:
+            parse_lock_actions(config)
+        except ValueError as e:
+            errors['lock_actions'] = str(e)
+    return errors
+
+
+class Settings:
+    """One validated version of the config plus the values derived from it"""
+
+    def __init__(self, config):
+        errors = validate_config(config)
+        if errors:
+            raise ConfigError(errors)
+        self.config = config
+        self.targets = configured_targets(config)
+        self.lock_actions = parse_lock_actions(config)
+        self.log_level = getattr(logging, config['log_level'].upper())
+
+
+def changed_keys(old, new):
+    """Keys whose values differ between two configs"""
+    return sorted(key for key in set(old) | set(new) if old.get(key) != new.get(key))